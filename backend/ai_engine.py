@@ -4,16 +4,272 @@ Integrates with Groq and OpenAI APIs for AI-powered features
 """
 
 import os
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Deque, Dict, List, Optional, Any, Set
 import asyncio
+import hashlib
 import httpx
+import itertools
 import json
-from datetime import datetime
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False  # SecurityScanner falls back to one str.find per pattern
+
+try:
+    from aiolimiter import AsyncLimiter
+    AIOLIMITER_AVAILABLE = True
+except ImportError:
+    AIOLIMITER_AVAILABLE = False  # Only the concurrency limit applies
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False  # Structured responses are parsed with the json module
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False  # Shared client stays on HTTP/1.1 keep-alive
 
 POE_AVAILABLE = True  # Using httpx for direct API calls
 
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_MODEL = "gpt-4o-mini"  # Fast and cost-effective
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.3-70b-versatile"  # Fast and capable
+AI_MAX_TOKENS = 2000  # Reply budget for one request
+SYSTEM_MESSAGE = "You are an expert AI coding assistant. Provide accurate, well-formatted code with clear explanations."
+BOT_NAME = "Claude-3-Opus"  # Legacy Poe bot name, passed through to call_ai_api
+NO_API_CONFIGURED_MESSAGE = """Error: No AI API configured!
+
+Please set ONE of these in your .env file:
+1. GROQ_API_KEY (from https://console.groq.com/keys) - FREE
+2. OPENAI_API_KEY (from https://platform.openai.com/api-keys)
+
+Example .env file:
+GROQ_API_KEY=gsk_...
+
+Then restart the backend server."""
+
+# Keywords that route lines of an AI response into result buckets
+_ISSUE_KW = frozenset({"issue", "problem", "concern", "warning", "error"})
+_SUGGESTION_KW = frozenset({"suggest", "recommend", "consider", "should", "could"})
+_STRENGTH_KW = frozenset({"good", "well", "strength", "excellent", "clear"})
+_CHANGE_KW = frozenset({"changed", "modified", "updated", "refactored", "improved"})
+_BENEFIT_KW = frozenset({"benefit", "advantage", "improve", "better", "faster"})
+_BOTTLENECK_KW = frozenset({"bottleneck", "slow", "inefficient", "expensive", "complexity"})
+_IMPROVEMENT_KW = frozenset({"optim", "improve", "faster", "cache", "index", "algorithm"})
+_REFERENCE_KW = frozenset({"documentation", "docs", "reference", "learn more", "see also", "read about"})
+_HIGH_SEVERITY_ERROR_KW = frozenset({"critical", "fatal", "exception", "error"})
+_REFERENCE_RE = re.compile(
+    "^.*(?:" + "|".join(re.escape(keyword) for keyword in sorted(_REFERENCE_KW)) + ").*$",
+    re.MULTILINE | re.IGNORECASE
+)
+# Substring alternations for the performance report classifier; searched per
+# line case-insensitively so no lowered copy of the line is needed
+_BOTTLENECK_RE = re.compile("|".join(re.escape(keyword) for keyword in sorted(_BOTTLENECK_KW)), re.IGNORECASE)
+_IMPROVEMENT_RE = re.compile("|".join(re.escape(keyword) for keyword in sorted(_IMPROVEMENT_KW)), re.IGNORECASE)
+_COMPLEXITY_RE = re.compile(r"(?-i:O\()|complexity", re.IGNORECASE)
+
+# A "- ", "* ", "• " or "1." style list item; group 1 is its text without the
+# marker (the marker may be followed by more marker characters, e.g. "1.) ")
+_SUGGESTION_RE = re.compile(
+    r"^[^\S\n]*(?:[-*] |â€¢ |\d[.):])(?:[-*â€¢\d.):]|[^\S\n])*([^-*â€¢\d.):\s].{9,}\S)[^\S\n]*$",
+    re.MULTILINE
+)
+
+# Markdown code fence: group 1 is the info string (language tag), group 2 the body.
+# A fence with no newline before its closing backticks is all body.
+_FENCE_RE = re.compile(r"```(?:([^`\n]*)\n)?(.*?)```", re.DOTALL)
+
+
+# List markers ("- ", "* ", "• ", "1. ") in front of an extracted bullet line; also
+# strips the mis-decoded bullet the old lstrip() character set was written with
+_BULLET_PREFIX_RE = re.compile(r"^[-•â€¢*0-9. ]+")
+
+# Markers DebugAnalyzer strips from its suggestion lines ("*" is kept so
+# "- **Bold**" items keep their emphasis)
+_DEBUG_BULLET_MARKERS = ("-", "â€¢")
+_DEBUG_BULLET_CHARS = "-â€¢0123456789. "
+
+
+def _extract_code_blocks(content: str) -> List[str]:
+    """Return the body of every fenced code block in an AI response"""
+    # Most responses have no fence; find() bails out of those without running
+    # the regex, and otherwise lets it start at the first fence
+    start = content.find("```")
+    if start < 0:
+        return []
+    return [match.group(2) for match in _FENCE_RE.finditer(content, start)]
+
+
+@lru_cache(maxsize=1)
+def get_api_key() -> Optional[str]:
+    """
+    Return the configured Groq or OpenAI key.
+    
+    Read from the environment once and shared by every analyzer class; call
+    get_api_key.cache_clear() if the key is changed at runtime.
+    """
+    return os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
+
+
+# Shared HTTP client so every AI call reuses one connection pool (TLS + keep-alive).
+# With h2 installed, requests to the same provider are multiplexed over one HTTP/2
+# connection, so only the first request of a burst pays for the TLS handshake.
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared AsyncClient used for all AI API calls.
+    
+    The client is created lazily on first use and rebuilt if the event loop
+    changed (e.g. between test runs), since httpx connections are loop-bound.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(timeout=60.0, limits=HTTP_LIMITS, http2=HTTP2_AVAILABLE)
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared AsyncClient (call on application shutdown)"""
+    global _http_client, _http_client_loop
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+
+
+# Limits on outgoing AI requests, so bursts queue here instead of ending in 429s
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_REQUESTS_PER_MINUTE = int(os.getenv("AI_REQUESTS_PER_MINUTE", "0"))
+_ai_semaphore: Optional[asyncio.Semaphore] = None
+_ai_rate_limiter: Optional["AsyncLimiter"] = None
+_ai_limits_loop: Optional[asyncio.AbstractEventLoop] = None
+
+if AI_REQUESTS_PER_MINUTE > 0 and not AIOLIMITER_AVAILABLE:
+    print("Warning: aiolimiter not installed. AI_REQUESTS_PER_MINUTE is ignored.")
+    print("Install with: pip install aiolimiter")
+
+
+@asynccontextmanager
+async def ai_request_slot():
+    """
+    Hold one of the AI_MAX_CONCURRENCY request slots, after waiting for the
+    AI_REQUESTS_PER_MINUTE rate limit when one is configured.
+    
+    Like the shared client, the semaphore and limiter are rebuilt when the
+    event loop changes.
+    """
+    global _ai_semaphore, _ai_rate_limiter, _ai_limits_loop
+    loop = asyncio.get_running_loop()
+    if _ai_semaphore is None or _ai_limits_loop is not loop:
+        _ai_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+        _ai_rate_limiter = (
+            AsyncLimiter(AI_REQUESTS_PER_MINUTE, 60)
+            if AIOLIMITER_AVAILABLE and AI_REQUESTS_PER_MINUTE > 0 else None
+        )
+        _ai_limits_loop = loop
+    
+    if _ai_rate_limiter is not None:
+        await _ai_rate_limiter.acquire()
+    async with _ai_semaphore:
+        yield
+
+
+# Transient failures worth retrying: rate limits, server errors and network errors
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+_RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+async def _post_with_retry(api_url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> httpx.Response:
+    """
+    POST an AI request, retrying transient failures with exponential backoff
+    
+    Waits roughly 1s, 2s, 4s (capped at 8s, with jitter) between attempts and
+    releases the request slot while waiting. The last response is returned (or
+    the last network error raised) once AI_MAX_RETRIES retries are used up.
+    """
+    client = get_http_client()
+    for attempt in range(AI_MAX_RETRIES + 1):
+        try:
+            async with ai_request_slot():
+                response = await client.post(api_url, json=payload, headers=headers)
+        except httpx.TransportError:
+            if attempt == AI_MAX_RETRIES:
+                raise
+        else:
+            if response.status_code not in _RETRY_STATUS_CODES or attempt == AI_MAX_RETRIES:
+                return response
+        await asyncio.sleep(min(8.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+# In-memory LRU of AI responses, keyed by a hash of the normalized prompt
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1024"))
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "3600"))
+_response_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_inflight: Dict[bytes, "asyncio.Future[str]"] = {}  # single-flight map, see call_ai_api
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Drop trailing whitespace so re-sent buffers that differ only there share an entry"""
+    return "\n".join(line.rstrip() for line in prompt.strip().splitlines())
+
+
+def _cache_key(api_type: str, prompt: str) -> bytes:
+    """Hash the provider and normalized prompt into a compact cache key"""
+    data = f"{api_type}\0{_normalize_prompt(prompt)}".encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _cache_get(key: bytes) -> Optional[str]:
+    """Return a fresh cached response, or None"""
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return value
+
+
+def _cache_put(key: bytes, value: str):
+    """Store a response, evicting the least recently used entries"""
+    if AI_CACHE_SIZE <= 0:
+        return
+    _response_cache[key] = (time.monotonic() + AI_CACHE_TTL, value)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > AI_CACHE_SIZE:
+        _response_cache.popitem(last=False)
 
-async def call_ai_api(api_key: str, bot_name: str, prompt: str, api_type: str = "auto") -> str:
+
+async def call_ai_api(
+    api_key: str,
+    bot_name: str,
+    prompt: str,
+    api_type: str = "auto",
+    system_prompt: Optional[str] = None,
+    json_mode: bool = False
+) -> str:
     """
     Call AI API (Groq or OpenAI) to get AI-powered responses
     
@@ -22,50 +278,224 @@ async def call_ai_api(api_key: str, bot_name: str, prompt: str, api_type: str =
         bot_name: Bot/model identifier (legacy parameter, not used)
         prompt: The prompt to send to the AI
         api_type: API type ("openai", "groq", or "auto" to detect)
+        system_prompt: Optional fixed instructions, sent as the system message so
+            providers can reuse their cached prompt prefix across requests
+        json_mode: Ask the provider for a single JSON object (the prompt must
+            mention JSON); parse the reply with parse_json_response
         
     Returns:
         AI-generated response text
     """
+    key = _cache_key(f"{api_type}:json" if json_mode else api_type, f"{system_prompt or ''}\0{prompt}")
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    
+    # Single-flight: identical concurrent requests await the same API call.
+    # Nothing is awaited between the lookup and the insert, so no lock is needed.
+    task = _inflight.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_fetch_ai_response(key, api_key, prompt, api_type, system_prompt, json_mode))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _inflight.pop(key) if _inflight.get(key) is done else None)
+    # shield() keeps one cancelled caller from cancelling the call for the others
+    return await asyncio.shield(task)
+
+
+async def _fetch_ai_response(
+    key: bytes,
+    api_key: str,
+    prompt: str,
+    api_type: str,
+    system_prompt: Optional[str],
+    json_mode: bool = False
+) -> str:
+    """Call the provider (or batcher) for a cache miss and cache the result"""
+    if api_type == "auto" and _batcher is not None and not json_mode:
+        batch_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        result = await _batcher.submit(batch_prompt)
+    else:
+        result = await _call_ai_provider(api_key, prompt, api_type, system_prompt, json_mode)
+    
+    if not result.startswith("Error:"):
+        _cache_put(key, result)
+    return result
+
+
+async def _call_ai_provider(
+    api_key: Optional[str],
+    prompt: str,
+    api_type: str = "auto",
+    system_prompt: Optional[str] = None,
+    json_mode: bool = False,
+    max_tokens: int = AI_MAX_TOKENS
+) -> str:
+    """Send a single prompt to the configured AI provider"""
     # Auto-detect API type based on key format or try multiple services
     if api_type == "auto":
         # Try Groq first (fast and free)
         groq_key = os.getenv("GROQ_API_KEY")
         if groq_key and groq_key != "your-groq-api-key-here":
-            result = await call_groq_api(groq_key, prompt)
+            result = await call_groq_api(groq_key, prompt, system_prompt, json_mode, max_tokens)
             if not result.startswith("Error:"):
                 return result
         
         # Try OpenAI second
         openai_key = os.getenv("OPENAI_API_KEY")
         if openai_key and openai_key != "your-openai-api-key-here":
-            result = await call_openai_api(openai_key, prompt)
+            result = await call_openai_api(openai_key, prompt, system_prompt, json_mode, max_tokens)
             if not result.startswith("Error:"):
                 return result
         
-        return """Error: No AI API configured!
-
-Please set ONE of these in your .env file:
-1. GROQ_API_KEY (from https://console.groq.com/keys) - FREE
-2. OPENAI_API_KEY (from https://platform.openai.com/api-keys)
-
-Example .env file:
-GROQ_API_KEY=gsk_...
-
-Then restart the backend server."""
+        return NO_API_CONFIGURED_MESSAGE
     elif api_type == "openai":
-        return await call_openai_api(api_key, prompt)
+        return await call_openai_api(api_key, prompt, system_prompt, json_mode, max_tokens)
     elif api_type == "groq":
-        return await call_groq_api(api_key, prompt)
+        return await call_groq_api(api_key, prompt, system_prompt, json_mode, max_tokens)
     else:
         return "Error: Unsupported API type. Use 'groq' or 'openai'."
 
 
-async def call_openai_api(api_key: str, prompt: str) -> str:
+class AIRequestBatcher:
+    """
+    Coalesce concurrent prompts into a single multi-prompt AI API call
+    
+    Prompts submitted within `max_wait_ms` of each other (up to `max_batch_size`)
+    are sent as one JSON envelope asking the model to answer each request, and
+    the answers are fanned back out to the waiting callers. If the model's reply
+    can't be parsed back into one answer per request, every prompt in the batch
+    is retried individually, so callers always get a normal response.
+    """
+    
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: int = 20, max_tokens: int = 8000):
+        # Each answer gets the usual single-request budget, so cap the batch by the total
+        self.max_batch_size = max(1, min(max_batch_size, max_tokens // AI_MAX_TOKENS))
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dispatches: Set[asyncio.Task] = set()  # strong refs until each batch finishes
+    
+    async def submit(self, prompt: str) -> str:
+        """Queue a prompt and wait for its answer"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._collect())
+        
+        future = loop.create_future()
+        await self._queue.put((prompt, future))
+        return await future
+    
+    async def _collect(self):
+        """Gather queued prompts into batches and dispatch them"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without blocking collection of the next batch
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch(self, batch: List[tuple]):
+        """Send one batch and resolve each caller's future"""
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            answers = None
+            if len(prompts) > 1:
+                content = await _call_ai_provider(
+                    None, self._build_envelope(prompts), max_tokens=AI_MAX_TOKENS * len(prompts)
+                )
+                answers = self._parse_answers(content, len(prompts))
+            if answers is None:
+                answers = await asyncio.gather(*(_call_ai_provider(None, p) for p in prompts))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
+    
+    @staticmethod
+    def _build_envelope(prompts: List[str]) -> str:
+        """Wrap several prompts into one request"""
+        requests = json.dumps([{"id": i, "request": p} for i, p in enumerate(prompts)])
+        return f"""You will receive {len(prompts)} independent requests as a JSON array.
+Answer each one completely and independently.
+Respond with ONLY a JSON array of {len(prompts)} strings, where element i is the full answer to the request with id i.
+
+Requests:
+{requests}"""
+    
+    @staticmethod
+    def _parse_answers(content: str, expected: int) -> Optional[List[str]]:
+        """Split a batched reply back into per-request answers"""
+        if content.startswith("Error:"):
+            return None
+        text = content.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+            text = text.rsplit("```", 1)[0]
+        try:
+            answers = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(answers, list) or len(answers) != expected:
+            return None
+        if not all(isinstance(answer, str) for answer in answers):
+            return None
+        return answers
+
+
+# Batching is opt-in: it trades a few milliseconds of queueing for fewer API round-trips
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "1"))
+AI_BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "20"))
+AI_BATCH_MAX_TOKENS = int(os.getenv("AI_BATCH_MAX_TOKENS", "8000"))
+_batcher: Optional[AIRequestBatcher] = (
+    AIRequestBatcher(AI_BATCH_SIZE, AI_BATCH_WINDOW_MS, AI_BATCH_MAX_TOKENS) if AI_BATCH_SIZE > 1 else None
+)
+
+
+def _build_messages(prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Build chat messages with the fixed instructions first.
+    
+    OpenAI and Groq cache identical prompt prefixes, so keeping per-feature
+    instructions in the system message (instead of prepending them to every
+    user prompt) lets repeated requests skip reprocessing that prefix.
+    """
+    system_content = f"{SYSTEM_MESSAGE}\n\n{system_prompt}" if system_prompt else SYSTEM_MESSAGE
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def call_openai_api(
+    api_key: str,
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    json_mode: bool = False,
+    max_tokens: int = AI_MAX_TOKENS
+) -> str:
     """
     Call OpenAI API (GPT-4, GPT-3.5-turbo, etc.)
     """
     try:
-        api_url = "https://api.openai.com/v1/chat/completions"
+        api_url = OPENAI_API_URL
         
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -73,38 +503,42 @@ async def call_openai_api(api_key: str, prompt: str) -> str:
         }
         
         payload = {
-            "model": "gpt-4o-mini",  # Fast and cost-effective
-            "messages": [
-                {"role": "system", "content": "You are an expert AI coding assistant. Provide accurate, well-formatted code with clear explanations."},
-                {"role": "user", "content": prompt}
-            ],
+            "model": OPENAI_MODEL,
+            "messages": _build_messages(prompt, system_prompt),
             "temperature": 0.7,
-            "max_tokens": 2000
+            "max_tokens": max_tokens
         }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(api_url, json=payload, headers=headers)
+        response = await _post_with_retry(api_url, payload, headers)
             
-            if response.status_code == 401:
-                return "Error: Invalid OPENAI_API_KEY. Get your key from https://platform.openai.com/api-keys"
-            elif response.status_code == 429:
-                return "Error: OpenAI rate limit exceeded. Please wait or check your billing."
-            elif response.status_code >= 400:
-                return f"Error: OpenAI API error {response.status_code}"
+        if response.status_code == 401:
+            return "Error: Invalid OPENAI_API_KEY. Get your key from https://platform.openai.com/api-keys"
+        elif response.status_code == 429:
+            return "Error: OpenAI rate limit exceeded. Please wait or check your billing."
+        elif response.status_code >= 400:
+            return f"Error: OpenAI API error {response.status_code}"
             
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+        result = response.json()
+        return result["choices"][0]["message"]["content"]
             
     except Exception as e:
         return f"Error: OpenAI API failed - {str(e)}"
 
 
-async def call_groq_api(api_key: str, prompt: str) -> str:
+async def call_groq_api(
+    api_key: str,
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    json_mode: bool = False,
+    max_tokens: int = AI_MAX_TOKENS
+) -> str:
     """
     Call Groq API (Fast, free inference with Llama, Mixtral, etc.)
     """
     try:
-        api_url = "https://api.groq.com/openai/v1/chat/completions"
+        api_url = GROQ_API_URL
         
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -112,32 +546,123 @@ async def call_groq_api(api_key: str, prompt: str) -> str:
         }
         
         payload = {
-            "model": "llama-3.3-70b-versatile",  # Fast and capable
-            "messages": [
-                {"role": "system", "content": "You are an expert AI coding assistant. Provide accurate, well-formatted code with clear explanations."},
-                {"role": "user", "content": prompt}
-            ],
+            "model": GROQ_MODEL,
+            "messages": _build_messages(prompt, system_prompt),
             "temperature": 0.7,
-            "max_tokens": 2000
+            "max_tokens": max_tokens
         }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(api_url, json=payload, headers=headers)
+        response = await _post_with_retry(api_url, payload, headers)
             
-            if response.status_code == 401:
-                return "Error: Invalid GROQ_API_KEY. Get your free key from https://console.groq.com/keys"
-            elif response.status_code == 429:
-                return "Error: Groq rate limit exceeded. Please wait a moment."
-            elif response.status_code >= 400:
-                return f"Error: Groq API error {response.status_code}"
+        if response.status_code == 401:
+            return "Error: Invalid GROQ_API_KEY. Get your free key from https://console.groq.com/keys"
+        elif response.status_code == 429:
+            return "Error: Groq rate limit exceeded. Please wait a moment."
+        elif response.status_code >= 400:
+            return f"Error: Groq API error {response.status_code}"
             
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+        result = response.json()
+        return result["choices"][0]["message"]["content"]
             
     except Exception as e:
         return f"Error: Groq API failed - {str(e)}"
 
 
+def parse_json_response(content: str) -> Optional[Any]:
+    """Decode a json_mode reply, or return None if the provider sent something else"""
+    try:
+        return orjson.loads(content) if ORJSON_AVAILABLE else json.loads(content)
+    except ValueError:  # orjson.JSONDecodeError and json.JSONDecodeError both subclass it
+        return None
+
+
+class _AIStreamError(Exception):
+    """Raised when a streaming provider rejects the request before sending text"""
+
+
+async def stream_ai_api(prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Stream an AI response as text chunks as soon as the provider produces them
+    
+    Tries Groq first, then OpenAI, like call_ai_api in auto mode. Falling back is
+    only possible before the first chunk has been sent to the caller.
+    """
+    providers = []
+    groq_key = os.getenv("GROQ_API_KEY")
+    if groq_key and groq_key != "your-groq-api-key-here":
+        providers.append((GROQ_API_URL, groq_key, GROQ_MODEL, "Groq"))
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if openai_key and openai_key != "your-openai-api-key-here":
+        providers.append((OPENAI_API_URL, openai_key, OPENAI_MODEL, "OpenAI"))
+    
+    if not providers:
+        yield NO_API_CONFIGURED_MESSAGE
+        return
+    
+    last_error = ""
+    for api_url, api_key, model, name in providers:
+        started = False
+        try:
+            async for chunk in _stream_chat_completion(api_url, api_key, model, prompt, system_prompt):
+                started = True
+                yield chunk
+            if started:
+                return
+            last_error = f"Empty response from {name} API"
+        except _AIStreamError as e:
+            last_error = f"{name} API error {e}"
+        except httpx.HTTPError as e:
+            if started:
+                yield f"\n\nError: {name} stream interrupted - {str(e)}"
+                return
+            last_error = f"{name} API failed - {str(e)}"
+    
+    yield f"Error: {last_error}"
+
+
+async def _stream_chat_completion(
+    api_url: str,
+    api_key: str,
+    model: str,
+    prompt: str,
+    system_prompt: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Yield content deltas from an OpenAI-compatible streaming chat completion"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": model,
+        "messages": _build_messages(prompt, system_prompt),
+        "temperature": 0.7,
+        "max_tokens": AI_MAX_TOKENS,
+        "stream": True
+    }
+    
+    client = get_http_client()
+    async with ai_request_slot(), client.stream("POST", api_url, json=payload, headers=headers) as response:
+        if response.status_code >= 400:
+            raise _AIStreamError(response.status_code)
+        
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data_str = line[6:].strip()
+            if data_str == "[DONE]":
+                break
+            try:
+                data = json.loads(data_str)
+            except json.JSONDecodeError:
+                continue
+            choices = data.get("choices") or []
+            text = choices[0].get("delta", {}).get("content") if choices else None
+            if text:
+                yield text
+
+
 async def call_poe_api(poe_api_key: str, bot_name: str, prompt: str) -> str:
     """
     Call Poe API using the correct SSE streaming protocol.
@@ -177,61 +702,63 @@ async def call_poe_api(poe_api_key: str, bot_name: str, prompt: str) -> str:
             "message_id": f"req-{ts}"
         }
         
-        full_text = ""
+        # Streamed text chunks, joined once at the end
+        chunks: List[str] = []
         
         # Stream SSE response
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            async with client.stream("POST", api_url, json=payload, headers=headers) as response:
-                if response.status_code == 401:
-                    return "Error: Invalid POE_API_KEY. Get your key from https://poe.com/api_key"
-                elif response.status_code == 403:
-                    return "Error: Poe access denied. Check your API key permissions at https://poe.com/api_key"
-                elif response.status_code == 404:
-                    # Try fallback bot name
-                    return await _call_poe_fallback(poe_api_key, prompt)
-                elif response.status_code == 429:
-                    return "Error: Poe rate limit exceeded. Please wait a moment and try again."
-                elif response.status_code >= 400:
-                    body = await response.aread()
-                    detail = body.decode()[:200] if body else "Unknown error"
-                    return f"Error: Poe API error {response.status_code}: {detail}"
+        client = get_http_client()
+        async with client.stream("POST", api_url, json=payload, headers=headers, timeout=120.0) as response:
+            if response.status_code == 401:
+                return "Error: Invalid POE_API_KEY. Get your key from https://poe.com/api_key"
+            elif response.status_code == 403:
+                return "Error: Poe access denied. Check your API key permissions at https://poe.com/api_key"
+            elif response.status_code == 404:
+                # Try fallback bot name
+                return await _call_poe_fallback(poe_api_key, prompt)
+            elif response.status_code == 429:
+                return "Error: Poe rate limit exceeded. Please wait a moment and try again."
+            elif response.status_code >= 400:
+                body = await response.aread()
+                detail = body.decode()[:200] if body else "Unknown error"
+                return f"Error: Poe API error {response.status_code}: {detail}"
                 
-                # Parse SSE events line by line
-                async for line in response.aiter_lines():
-                    line = line.strip()
-                    if not line or not line.startswith("data: "):
-                        continue
+            # Parse SSE events line by line
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line or not line.startswith("data: "):
+                    continue
                     
-                    data_str = line[6:]   # Strip "data: " prefix
-                    if data_str in ("[DONE]", "{}"):
-                        continue
+                data_str = line[6:]   # Strip "data: " prefix
+                if data_str in ("[DONE]", "{}"):
+                    continue
                     
-                    try:
-                        data = json.loads(data_str)
-                        event = data.get("event", "")
+                try:
+                    data = json.loads(data_str)
+                    event = data.get("event", "")
                         
-                        if event == "text":
-                            # Append streamed text chunk
-                            text_data = data.get("data", {})
-                            if isinstance(text_data, dict):
-                                full_text += text_data.get("text", "")
-                            elif isinstance(text_data, str):
-                                full_text += text_data
-                        elif event == "replace_response":
-                            text_data = data.get("data", {})
-                            if isinstance(text_data, dict):
-                                full_text = text_data.get("text", full_text)
-                        elif event == "done":
-                            break
-                        elif event == "error":
-                            err_data = data.get("data", {})
-                            err_msg = err_data.get("text", str(err_data)) if isinstance(err_data, dict) else str(err_data)
-                            return f"Error: Poe bot error - {err_msg}"
-                    except json.JSONDecodeError:
-                        # Some lines may be plain text
-                        if data_str and data_str != "[DONE]":
-                            full_text += data_str
-        
+                    if event == "text":
+                        # Append streamed text chunk
+                        text_data = data.get("data", {})
+                        if isinstance(text_data, dict):
+                            chunks.append(text_data.get("text", ""))
+                        elif isinstance(text_data, str):
+                            chunks.append(text_data)
+                    elif event == "replace_response":
+                        text_data = data.get("data", {})
+                        if isinstance(text_data, dict) and "text" in text_data:
+                            chunks = [text_data["text"]]
+                    elif event == "done":
+                        break
+                    elif event == "error":
+                        err_data = data.get("data", {})
+                        err_msg = err_data.get("text", str(err_data)) if isinstance(err_data, dict) else str(err_data)
+                        return f"Error: Poe bot error - {err_msg}"
+                except json.JSONDecodeError:
+                    # Some lines may be plain text
+                    if data_str and data_str != "[DONE]":
+                        chunks.append(data_str)
+        
+        full_text = "".join(chunks)
         return full_text if full_text else "Error: Empty response from Poe API. Try a different bot or check your API key."
         
     except httpx.TimeoutException:
@@ -264,28 +791,29 @@ async def _call_poe_fallback(poe_api_key: str, prompt: str) -> str:
                 "conversation_id": f"conv-{ts}",
                 "message_id": f"req-{ts}"
             }
-            full_text = ""
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                async with client.stream("POST", api_url, json=payload, headers=headers) as response:
-                    if response.status_code not in (200, 201):
+            chunks: List[str] = []
+            client = get_http_client()
+            async with client.stream("POST", api_url, json=payload, headers=headers, timeout=120.0) as response:
+                if response.status_code not in (200, 201):
+                    continue
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if not line or not line.startswith("data: "):
+                        continue
+                    data_str = line[6:]
+                    if data_str in ("[DONE]", "{}"):
                         continue
-                    async for line in response.aiter_lines():
-                        line = line.strip()
-                        if not line or not line.startswith("data: "):
-                            continue
-                        data_str = line[6:]
-                        if data_str in ("[DONE]", "{}"):
-                            continue
-                        try:
-                            data = json.loads(data_str)
-                            event = data.get("event", "")
-                            if event == "text":
-                                text_data = data.get("data", {})
-                                full_text += text_data.get("text", "") if isinstance(text_data, dict) else str(text_data)
-                            elif event == "done":
-                                break
-                        except json.JSONDecodeError:
-                            pass
+                    try:
+                        data = json.loads(data_str)
+                        event = data.get("event", "")
+                        if event == "text":
+                            text_data = data.get("data", {})
+                            chunks.append(text_data.get("text", "") if isinstance(text_data, dict) else str(text_data))
+                        elif event == "done":
+                            break
+                    except json.JSONDecodeError:
+                        pass
+            full_text = "".join(chunks)
             if full_text:
                 return full_text
         except Exception:
@@ -298,18 +826,18 @@ class CodeGenerator:
     Generate code from natural language using AI models
     """
     
+    # No per-instance __dict__; these are the only instance attributes
+    __slots__ = ("api_key", "bot_name", "model", "tokenizer")
+    
     def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
         
         if self.api_key:
-            # Configure Groq/OpenAI API
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Poe API
             print("âœ“ Using Poe API with Claude-3-Opus")
         else:
             print("ERROR: GROQ_API_KEY or OPENAI_API_KEY not configured")
             print("Set GROQ_API_KEY or OPENAI_API_KEY in your .env file")
-            pass  # Groq/OpenAI API configured
     
     async def generate(
         self, 
@@ -321,11 +849,7 @@ class CodeGenerator:
         """
         Generate code from natural language prompt
         """
-        # Simple, direct prompt for brief code generation
-        full_prompt = f"""Write {language} code: {prompt}
-{f'Context: {context}' if context else ''}
-
-Return: Working code with brief explanation."""
+        full_prompt = self._build_prompt(prompt, language, context)
         
         if not self.api_key:
             return {
@@ -338,6 +862,26 @@ Return: Working code with brief explanation."""
         result = await self._generate_with_poe(full_prompt)
         return result
     
+    async def generate_stream(
+        self,
+        prompt: str,
+        language: str,
+        context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated code and explanation as it is produced
+        """
+        async for chunk in stream_ai_api(self._build_prompt(prompt, language, context)):
+            yield chunk
+    
+    def _build_prompt(self, prompt: str, language: str, context: Optional[str] = None) -> str:
+        """Build the code generation prompt"""
+        # Simple, direct prompt for brief code generation
+        return f"""Write {language} code: {prompt}
+{f'Context: {context}' if context else ''}
+
+Return: Working code with brief explanation."""
+    
     async def _generate_with_poe(self, full_prompt: str) -> Dict[str, Any]:
         """Generate using Poe API via HTTP"""
         
@@ -362,15 +906,13 @@ Return: Working code with brief explanation."""
             }
         
         # Simple response parsing for brief code-focused output
-        import re
-        
         # Extract code from markdown code blocks
-        code_match = re.search(r'```(?:\w+)?\n(.+?)```', content, re.DOTALL)
+        code_match = _FENCE_RE.search(content)
         
-        if code_match:
-            code = code_match.group(1).strip()
+        if code_match and code_match.group(2).strip():
+            code = code_match.group(2).strip()
             # Get explanation (text before code block, keep it brief)
-            explanation = content[:content.find('```')].strip()
+            explanation = content[:code_match.start()].strip()
             if not explanation:
                 # Try text after code block
                 explanation = content[content.rfind('```')+3:].strip()
@@ -434,19 +976,30 @@ Return: Working code with brief explanation."""
 """
 
 
+@lru_cache(maxsize=256)
+def _render_prompt(template: str, **fields: str) -> str:
+    """Fill a system prompt template, once per distinct template and fields"""
+    return template.format(**fields)
+
+
 class DebugAnalyzer:
     """
     Analyze code and provide debugging suggestions
     """
     
+    __slots__ = ("api_key", "bot_name")
+    
+    SYSTEM_PROMPT = """You are an expert debugger for {language}.
+Analyze the code and provide:
+1. Potential bugs or issues
+2. Detailed explanations of problems
+3. Fixed version of the code
+4. Best practices recommendations
+"""
+    
     def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
     
     async def analyze(
         self, 
@@ -457,19 +1010,7 @@ class DebugAnalyzer:
         """
         Analyze code for bugs and provide suggestions
         """
-        system_prompt = f"""You are an expert debugger for {language}.
-Analyze the code and provide:
-1. Potential bugs or issues
-2. Detailed explanations of problems
-3. Fixed version of the code
-4. Best practices recommendations
-"""
-        
-        user_prompt = f"Code to debug:\n```{language}\n{code}\n```\n"
-        if error_message:
-            user_prompt += f"\nError message: {error_message}\n"
-        
-        user_prompt += "\nProvide debugging analysis and suggestions."
+        system_prompt, user_prompt = self._build_prompts(code, language, error_message)
         
         if not self.api_key:
             return {
@@ -479,27 +1020,22 @@ Analyze the code and provide:
                 "severity": "high"
             }
         
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
-        
         try:
-            content = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+            content = await call_ai_api(self.api_key, self.bot_name, user_prompt, system_prompt=system_prompt)
         except Exception as e:
             content = f"Error calling AI API: {str(e)}"
         
         # Extract fixed code if present
-        fixed_code = None
-        if "```" in content:
-            code_blocks = content.split("```")
-            if len(code_blocks) >= 3:
-                fixed_code = code_blocks[1].split("\n", 1)[1] if "\n" in code_blocks[1] else code_blocks[1]
+        code_blocks = _extract_code_blocks(content)
+        fixed_code = code_blocks[0] if code_blocks else None
         
         # Extract suggestions (look for bullet points or numbered lists)
         suggestions = []
         lines = content.split("\n")
         for line in lines:
             line = line.strip()
-            if line.startswith("-") or line.startswith("â€¢") or (len(line) > 0 and line[0].isdigit() and "." in line[:3]):
-                suggestions.append(line.lstrip("-â€¢0123456789. "))
+            if line.startswith(_DEBUG_BULLET_MARKERS) or (line[:1].isdigit() and "." in line[:3]):
+                suggestions.append(line.lstrip(_DEBUG_BULLET_CHARS))
         
         # If no suggestions found, create default ones
         if not suggestions:
@@ -512,7 +1048,8 @@ Analyze the code and provide:
         # Determine severity based on error_message presence and content
         severity = "medium"
         if error_message:
-            if any(keyword in error_message.lower() for keyword in ["critical", "fatal", "exception", "error"]):
+            error_lower = error_message.lower()
+            if any(keyword in error_lower for keyword in _HIGH_SEVERITY_ERROR_KW):
                 severity = "high"
         else:
             severity = "low"
@@ -523,6 +1060,30 @@ Analyze the code and provide:
             "fixed_code": fixed_code,
             "severity": severity
         }
+    
+    async def analyze_stream(
+        self,
+        code: str,
+        language: str,
+        error_message: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the debugging analysis as it is produced
+        """
+        system_prompt, user_prompt = self._build_prompts(code, language, error_message)
+        async for chunk in stream_ai_api(user_prompt, system_prompt=system_prompt):
+            yield chunk
+    
+    def _build_prompts(self, code: str, language: str, error_message: Optional[str] = None) -> tuple:
+        """Build the (system, user) prompts for a debugging request"""
+        system_prompt = _render_prompt(self.SYSTEM_PROMPT, language=language)
+        
+        user_prompt = f"Code to debug:\n```{language}\n{code}\n```\n"
+        if error_message:
+            user_prompt += f"\nError message: {error_message}\n"
+        
+        user_prompt += "\nProvide debugging analysis and suggestions."
+        return system_prompt, user_prompt
 
 
 class SecurityScanner:
@@ -530,14 +1091,36 @@ class SecurityScanner:
     Scan code for security vulnerabilities
     """
     
+    __slots__ = ("api_key", "bot_name", "vulnerability_patterns", "vulnerability_automata")
+    
+    SYSTEM_PROMPT = """You are a security expert analyzing {language} code.
+Identify security vulnerabilities including:
+- SQL injection
+- XSS attacks
+- CSRF vulnerabilities
+- Authentication issues
+- Data exposure
+- Insecure dependencies
+For each issue found, provide: type, severity (critical/high/medium/low), description, and recommendation.
+Format as bullet points with clear structure.
+"""
+    
+    # Most severe first: a line mentioning several levels counts as the highest
+    SEVERITY_LEVELS = ("critical", "high", "medium", "low")
+    
+    # General recommendations, shared by every scan result (read-only)
+    RECOMMENDATIONS = (
+        "Use parameterized queries to prevent SQL injection",
+        "Sanitize and validate all user inputs",
+        "Implement proper authentication and authorization",
+        "Use HTTPS for all communications",
+        "Keep dependencies up to date",
+        "Follow OWASP security guidelines"
+    )
+    
     def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
         
         # Common vulnerability patterns
         self.vulnerability_patterns = {
@@ -554,6 +1137,18 @@ class SecurityScanner:
                 ("dangerouslySetInnerHTML", "XSS risk"),
             ]
         }
+        
+        # Multi-pattern matchers so scan() finds every pattern in a single pass.
+        # Aho-Corasick stays linear in code length however many patterns are added;
+        # without it, each pattern is searched for separately.
+        self.vulnerability_automata = {}
+        if AHOCORASICK_AVAILABLE:
+            for language, patterns in self.vulnerability_patterns.items():
+                automaton = ahocorasick.Automaton()
+                for i, (pattern, _) in enumerate(patterns):
+                    automaton.add_word(pattern, i)
+                automaton.make_automaton()
+                self.vulnerability_automata[language] = automaton
     
     async def scan(
         self, 
@@ -564,55 +1159,34 @@ class SecurityScanner:
         """
         Scan code for security vulnerabilities
         """
-        issues = []
-        severity_counts = {"critical": 0, "high": 0, "medium": 0, "low": 0}
-        
-        # Pattern-based detection
-        if language in self.vulnerability_patterns:
-            for pattern, description in self.vulnerability_patterns[language]:
-                if pattern in code:
-                    issues.append({
-                        "type": f"{pattern.strip('(')} Usage Detected",
-                        "severity": "high",
-                        "line": self._find_line_number(code, pattern),
-                        "description": description,
-                        "recommendation": f"Avoid using {pattern.strip('(')} or ensure proper input validation and sanitization"
-                    })
-                    severity_counts["high"] += 1
-        
         # AI-based deep analysis
-        system_prompt = f"""You are a security expert analyzing {language} code.
-Identify security vulnerabilities including:
-- SQL injection
-- XSS attacks
-- CSRF vulnerabilities
-- Authentication issues
-- Data exposure
-- Insecure dependencies
-For each issue found, provide: type, severity (critical/high/medium/low), description, and recommendation.
-Format as bullet points with clear structure.
-"""
+        system_prompt = _render_prompt(self.SYSTEM_PROMPT, language=language)
         
         user_prompt = f"Analyze this {language} code for security issues:\n```{language}\n{code}\n```"
         
+        # Start the AI request, then run the pattern scan in a worker thread; awaiting
+        # the scan hands the loop to the request, so the two overlap
+        ai_task = None
         if self.api_key:
+            ai_task = asyncio.create_task(
+                call_ai_api(self.api_key, self.bot_name, user_prompt, system_prompt=system_prompt)
+            )
+        
+        issues = await asyncio.to_thread(self._pattern_issues, code, language)
+        severity_counts = {"critical": 0, "high": len(issues), "medium": 0, "low": 0}
+        
+        if ai_task is not None:
             try:
-                full_prompt = f"{system_prompt}\n\n{user_prompt}"
-                ai_analysis = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+                ai_analysis = await ai_task
                 
                 # Parse AI analysis for additional issues
                 # Look for severity indicators in the response
-                lines = ai_analysis.lower().split('\n')
-                for line in lines:
-                    if any(word in line for word in ['critical', 'high', 'medium', 'low']):
-                        if 'critical' in line:
-                            severity_counts['critical'] += 1
-                        elif 'high' in line:
-                            severity_counts['high'] += 1
-                        elif 'medium' in line:
-                            severity_counts['medium'] += 1
-                        elif 'low' in line:
-                            severity_counts['low'] += 1
+                # (each line counts once, for its most severe level)
+                for line in ai_analysis.lower().splitlines():
+                    for level in self.SEVERITY_LEVELS:
+                        if level in line:
+                            severity_counts[level] += 1
+                            break
             except Exception as e:
                 ai_analysis = f"AI analysis unavailable: {str(e)}"
         
@@ -628,29 +1202,88 @@ Format as bullet points with clear structure.
         else:
             overall_risk = "low"
         
-        # General recommendations
-        recommendations = [
-            "Use parameterized queries to prevent SQL injection",
-            "Sanitize and validate all user inputs",
-            "Implement proper authentication and authorization",
-            "Use HTTPS for all communications",
-            "Keep dependencies up to date",
-            "Follow OWASP security guidelines"
-        ]
-        
         return {
             "issues": issues,
             "overall_risk": overall_risk,
-            "recommendations": recommendations
+            "recommendations": self.RECOMMENDATIONS
         }
     
-    def _find_line_number(self, code: str, pattern: str) -> int:
-        """Find line number of a pattern in code"""
-        lines = code.split("\n")
-        for i, line in enumerate(lines, 1):
-            if pattern in line:
-                return i
-        return 0
+    def _pattern_issues(self, code: str, language: str) -> List[Dict[str, Any]]:
+        """Pattern-based detection: one high-severity issue per pattern found in the code"""
+        if language not in self.vulnerability_patterns:
+            return []
+        
+        patterns = self.vulnerability_patterns[language]
+        first_offsets = self._first_offsets(code, language)
+        line_numbers = self._line_numbers(code, first_offsets)
+        return [
+            {
+                "type": f"{pattern.strip('(')} Usage Detected",
+                "severity": "high",
+                "line": line_numbers[i],
+                "description": description,
+                "recommendation": f"Avoid using {pattern.strip('(')} or ensure proper input validation and sanitization"
+            }
+            for i, (pattern, description) in enumerate(patterns)
+            if i in first_offsets
+        ]
+    
+    def _first_offsets(self, code: str, language: str) -> Dict[int, int]:
+        """Map each matched pattern index to the offset of its first occurrence"""
+        patterns = self.vulnerability_patterns[language]
+        first_offsets: Dict[int, int] = {}
+        
+        automaton = self.vulnerability_automata.get(language)
+        if automaton is not None:
+            for end, i in automaton.iter(code):
+                first_offsets.setdefault(i, end - len(patterns[i][0]) + 1)
+                if len(first_offsets) == len(patterns):
+                    break
+        else:
+            # One search per pattern, so patterns overlapping another's match are still found
+            for i, (pattern, _) in enumerate(patterns):
+                offset = code.find(pattern)
+                if offset >= 0:
+                    first_offsets[i] = offset
+        
+        return first_offsets
+    
+    @staticmethod
+    def _line_numbers(code: str, offsets: Dict[int, int]) -> Dict[int, int]:
+        """
+        Map each key of offsets to the 1-based line containing its offset.
+        Newlines are counted once, walking the offsets in order.
+        """
+        line_numbers: Dict[int, int] = {}
+        line, position = 1, 0
+        for key, offset in sorted(offsets.items(), key=lambda item: item[1]):
+            line += code.count("\n", position, offset)
+            position = offset
+            line_numbers[key] = line
+        return line_numbers
+
+
+def _classify_lines(content: str, buckets: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Sort the bullet lines of an AI response into keyword buckets in one pass.
+
+    ``buckets`` maps a bucket name to ``(keywords, limit)``; a line lands in
+    every bucket whose keywords it mentions, until that bucket is full.
+    """
+    result: Dict[str, List[str]] = {name: [] for name in buckets}
+    for line in content.splitlines():
+        stripped = line.strip()
+        line_lower = stripped.lower()
+        cleaned = None
+        for name, (keywords, limit) in buckets.items():
+            found = result[name]
+            if len(found) >= limit or not any(word in line_lower for word in keywords):
+                continue
+            if cleaned is None:
+                cleaned = _BULLET_PREFIX_RE.sub("", stripped)
+            if len(cleaned) > 10:
+                found.append(cleaned)
+    return result
 
 
 class CodeReviewer:
@@ -658,18 +1291,9 @@ class CodeReviewer:
     AI-powered code review with best practices and suggestions
     """
     
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+    __slots__ = ("api_key", "bot_name")
     
-    async def review(self, code: str, language: str, context: Optional[str] = None) -> Dict[str, Any]:
-        """Perform comprehensive code review"""
-        system_prompt = f"""You are a senior {language} code reviewer.
+    SYSTEM_PROMPT = """You are a senior {language} code reviewer.
 Perform a thorough code review covering:
 1. Code quality and readability
 2. Best practices and design patterns
@@ -679,7 +1303,21 @@ Perform a thorough code review covering:
 6. Maintainability concerns
 7. Testing recommendations
 
-Provide specific, actionable feedback with examples."""
+Provide specific, actionable feedback with examples.
+
+Respond with a JSON object with these keys:
+- "review": the full review as markdown
+- "issues": list of specific problems found
+- "suggestions": list of actionable improvements
+- "strengths": list of things the code does well"""
+    
+    def __init__(self):
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
+    
+    async def review(self, code: str, language: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """Perform comprehensive code review"""
+        system_prompt = _render_prompt(self.SYSTEM_PROMPT, language=language)
 
         user_prompt = f"Review this {language} code:\n```{language}\n{code}\n```"
         if context:
@@ -695,13 +1333,23 @@ Provide specific, actionable feedback with examples."""
             }
         
         try:
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            content = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+            content = await call_ai_api(
+                self.api_key, self.bot_name, user_prompt,
+                system_prompt=system_prompt, json_mode=True
+            )
             
-            # Parse review content
-            issues = self._extract_issues(content)
-            suggestions = self._extract_suggestions(content)
-            strengths = self._extract_strengths(content)
+            # Use the structured reply; fall back to parsing free text
+            data = parse_json_response(content)
+            if isinstance(data, dict) and isinstance(data.get("review"), str):
+                content = data["review"]
+                issues = self._string_list(data.get("issues"))
+                suggestions = self._string_list(data.get("suggestions"))
+                strengths = self._string_list(data.get("strengths"))
+            else:
+                buckets = self._classify_lines(content)
+                issues = buckets["issues"]
+                suggestions = buckets["suggestions"]
+                strengths = buckets["strengths"]
             
             # Calculate score based on issues found
             score = max(0, 100 - len(issues) * 5)
@@ -724,51 +1372,34 @@ Provide specific, actionable feedback with examples."""
                 "improvements": []
             }
     
-    def _extract_issues(self, content: str) -> List[str]:
-        """Extract issues from review content"""
-        issues = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['issue', 'problem', 'concern', 'warning', 'error']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    issues.append(cleaned)
-        return issues[:10]
+    REVIEW_BUCKETS = {
+        "issues": (_ISSUE_KW, 10),
+        "suggestions": (_SUGGESTION_KW, 10),
+        "strengths": (_STRENGTH_KW, 5),
+    }
+
+    def _classify_lines(self, content: str) -> Dict[str, List[str]]:
+        """Extract issues, suggestions and strengths from review content"""
+        return _classify_lines(content, self.REVIEW_BUCKETS)
     
-    def _extract_suggestions(self, content: str) -> List[str]:
-        """Extract suggestions from review content"""
-        suggestions = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['suggest', 'recommend', 'consider', 'should', 'could']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    suggestions.append(cleaned)
-        return suggestions[:10]
-    
-    def _extract_strengths(self, content: str) -> List[str]:
-        """Extract strengths from review content"""
-        strengths = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['good', 'well', 'strength', 'excellent', 'clear']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    strengths.append(cleaned)
-        return strengths[:5]
-    
-    def _generate_improvements(self, content: str) -> List[str]:
+    @staticmethod
+    def _string_list(value: Any) -> List[str]:
+        """Keep the non-empty strings of a JSON list field"""
+        if not isinstance(value, list):
+            return []
+        return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    
+    IMPROVEMENTS = (
+        "Follow SOLID principles",
+        "Add comprehensive error handling",
+        "Improve code documentation",
+        "Consider adding unit tests",
+        "Review for performance optimizations"
+    )
+    
+    def _generate_improvements(self, content: str) -> tuple:
         """Generate improvement recommendations"""
-        return [
-            "Follow SOLID principles",
-            "Add comprehensive error handling",
-            "Improve code documentation",
-            "Consider adding unit tests",
-            "Review for performance optimizations"
-        ]
+        return self.IMPROVEMENTS
 
 
 class CodeRefactorer:
@@ -776,33 +1407,36 @@ class CodeRefactorer:
     AI-powered code refactoring assistant
     """
     
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+    __slots__ = ("api_key", "bot_name")
     
-    async def refactor(self, code: str, language: str, refactor_type: str = "general") -> Dict[str, Any]:
-        """Refactor code for better quality"""
-        refactor_prompts = {
-            "general": "Refactor for overall code quality, readability, and maintainability",
-            "performance": "Optimize for better performance and efficiency",
-            "clean_code": "Apply clean code principles and best practices",
-            "design_patterns": "Apply appropriate design patterns",
-            "simplify": "Simplify and reduce complexity"
-        }
-        
-        system_prompt = f"""You are an expert {language} developer specializing in code refactoring.
-{refactor_prompts.get(refactor_type, refactor_prompts['general'])}
+    REFACTOR_PROMPTS = {
+        "general": "Refactor for overall code quality, readability, and maintainability",
+        "performance": "Optimize for better performance and efficiency",
+        "clean_code": "Apply clean code principles and best practices",
+        "design_patterns": "Apply appropriate design patterns",
+        "simplify": "Simplify and reduce complexity"
+    }
+    
+    SYSTEM_PROMPT = """You are an expert {language} developer specializing in code refactoring.
+{instructions}
 
 Provide:
 1. Refactored code
 2. Explanation of changes made
 3. Benefits of the refactoring
 4. Migration notes if applicable"""
+    
+    def __init__(self):
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
+    
+    async def refactor(self, code: str, language: str, refactor_type: str = "general") -> Dict[str, Any]:
+        """Refactor code for better quality"""
+        system_prompt = _render_prompt(
+            self.SYSTEM_PROMPT,
+            language=language,
+            instructions=self.REFACTOR_PROMPTS.get(refactor_type, self.REFACTOR_PROMPTS['general'])
+        )
 
         user_prompt = f"Refactor this {language} code:\n```{language}\n{code}\n```"
         
@@ -815,21 +1449,18 @@ Provide:
             }
         
         try:
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            content = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+            content = await call_ai_api(self.api_key, self.bot_name, user_prompt, system_prompt=system_prompt)
             
             # Extract refactored code
-            refactored_code = code
-            if "```" in content:
-                code_blocks = content.split("```")
-                if len(code_blocks) >= 3:
-                    refactored_code = code_blocks[1].split("\n", 1)[1] if "\n" in code_blocks[1] else code_blocks[1]
+            code_blocks = _extract_code_blocks(content)
+            refactored_code = code_blocks[0] if code_blocks else code
             
+            buckets = self._classify_lines(content)
             return {
                 "refactored_code": refactored_code.strip(),
                 "explanation": content,
-                "changes": self._extract_changes(content),
-                "benefits": self._extract_benefits(content),
+                "changes": buckets["changes"],
+                "benefits": buckets["benefits"],
                 "diff_summary": f"Refactored using {refactor_type} approach"
             }
         except Exception as e:
@@ -841,29 +1472,14 @@ Provide:
                 "diff_summary": "Error occurred"
             }
     
-    def _extract_changes(self, content: str) -> List[str]:
-        """Extract changes from refactoring explanation"""
-        changes = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['changed', 'modified', 'updated', 'refactored', 'improved']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    changes.append(cleaned)
-        return changes[:8]
-    
-    def _extract_benefits(self, content: str) -> List[str]:
-        """Extract benefits from refactoring explanation"""
-        benefits = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['benefit', 'advantage', 'improve', 'better', 'faster']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    benefits.append(cleaned)
-        return benefits[:5]
+    REFACTOR_BUCKETS = {
+        "changes": (_CHANGE_KW, 8),
+        "benefits": (_BENEFIT_KW, 5),
+    }
+
+    def _classify_lines(self, content: str) -> Dict[str, List[str]]:
+        """Extract changes and benefits from refactoring explanation"""
+        return _classify_lines(content, self.REFACTOR_BUCKETS)
 
 
 class TestGenerator:
@@ -871,30 +1487,9 @@ class TestGenerator:
     AI-powered test case generation
     """
     
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+    __slots__ = ("api_key", "bot_name")
     
-    async def generate_tests(self, code: str, language: str, test_framework: Optional[str] = None) -> Dict[str, Any]:
-        """Generate comprehensive test cases for code"""
-        # Determine test framework based on language if not specified
-        if not test_framework:
-            frameworks = {
-                "python": "pytest",
-                "javascript": "jest",
-                "typescript": "jest",
-                "java": "junit",
-                "go": "testing",
-                "ruby": "rspec"
-            }
-            test_framework = frameworks.get(language.lower(), "unittest")
-        
-        system_prompt = f"""You are an expert in {language} testing using {test_framework}.
+    SYSTEM_PROMPT = """You are an expert in {language} testing using {test_framework}.
 Generate comprehensive test cases including:
 1. Unit tests for individual functions
 2. Edge cases and boundary conditions
@@ -904,6 +1499,36 @@ Generate comprehensive test cases including:
 6. Mock/stub recommendations where needed
 
 Follow {test_framework} best practices and conventions."""
+    
+    # Default test framework per language when the caller doesn't pick one
+    FRAMEWORKS = {
+        "python": "pytest",
+        "javascript": "jest",
+        "typescript": "jest",
+        "java": "junit",
+        "go": "testing",
+        "ruby": "rspec"
+    }
+    
+    SETUP_INSTRUCTIONS = {
+        "pytest": "Install: pip install pytest\nRun: pytest test_file.py",
+        "jest": "Install: npm install --save-dev jest\nRun: npm test",
+        "junit": "Add JUnit dependency and run with your build tool",
+        "testing": "Tests are built-in to Go\nRun: go test",
+        "rspec": "Install: gem install rspec\nRun: rspec spec/"
+    }
+    
+    def __init__(self):
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
+    
+    async def generate_tests(self, code: str, language: str, test_framework: Optional[str] = None) -> Dict[str, Any]:
+        """Generate comprehensive test cases for code"""
+        # Determine test framework based on language if not specified
+        if not test_framework:
+            test_framework = self.FRAMEWORKS.get(language.lower(), "unittest")
+        
+        system_prompt = _render_prompt(self.SYSTEM_PROMPT, language=language, test_framework=test_framework)
 
         user_prompt = f"Generate tests for this {language} code:\n```{language}\n{code}\n```"
         
@@ -916,15 +1541,11 @@ Follow {test_framework} best practices and conventions."""
             }
         
         try:
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            content = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+            content = await call_ai_api(self.api_key, self.bot_name, user_prompt, system_prompt=system_prompt)
             
             # Extract test code
-            test_code = ""
-            if "```" in content:
-                code_blocks = content.split("```")
-                if len(code_blocks) >= 3:
-                    test_code = code_blocks[1].split("\n", 1)[1] if "\n" in code_blocks[1] else code_blocks[1]
+            code_blocks = _extract_code_blocks(content)
+            test_code = code_blocks[0] if code_blocks else ""
             
             # Count test cases
             test_count = test_code.count("def test_") + test_code.count("test(") + test_code.count("it(")
@@ -952,22 +1573,16 @@ Follow {test_framework} best practices and conventions."""
         test_cases = []
         lines = content.split('\n')
         for line in lines:
-            if 'test' in line.lower() and ('def' in line or 'it(' in line or 'describe' in line):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 5:
+            stripped = line.strip()
+            if 'test' in stripped.lower() and ('def' in stripped or 'it(' in stripped or 'describe' in stripped):
+                cleaned = _BULLET_PREFIX_RE.sub("", stripped)
+                if len(cleaned) > 5:
                     test_cases.append(cleaned)
         return test_cases[:15]
     
     def _generate_setup_instructions(self, framework: str) -> str:
         """Generate setup instructions for test framework"""
-        instructions = {
-            "pytest": "Install: pip install pytest\nRun: pytest test_file.py",
-            "jest": "Install: npm install --save-dev jest\nRun: npm test",
-            "junit": "Add JUnit dependency and run with your build tool",
-            "testing": "Tests are built-in to Go\nRun: go test",
-            "rspec": "Install: gem install rspec\nRun: rspec spec/"
-        }
-        return instructions.get(framework, "Refer to framework documentation")
+        return self.SETUP_INSTRUCTIONS.get(framework, "Refer to framework documentation")
 
 
 class PerformanceOptimizer:
@@ -975,18 +1590,9 @@ class PerformanceOptimizer:
     AI-powered performance optimization analyzer
     """
     
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+    __slots__ = ("api_key", "bot_name")
     
-    async def optimize(self, code: str, language: str, context: Optional[str] = None) -> Dict[str, Any]:
-        """Analyze and optimize code for performance"""
-        system_prompt = f"""You are a performance optimization expert for {language}.
+    SYSTEM_PROMPT = """You are a performance optimization expert for {language}.
 Analyze the code and provide:
 1. Performance bottlenecks identification
 2. Time complexity analysis (Big O notation)
@@ -996,6 +1602,14 @@ Analyze the code and provide:
 6. Benchmarking recommendations
 7. Caching strategies if applicable
 8. Database query optimizations if applicable"""
+    
+    def __init__(self):
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
+    
+    async def optimize(self, code: str, language: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze and optimize code for performance"""
+        system_prompt = _render_prompt(self.SYSTEM_PROMPT, language=language)
 
         user_prompt = f"Analyze and optimize this {language} code:\n```{language}\n{code}\n```"
         if context:
@@ -1011,26 +1625,26 @@ Analyze the code and provide:
             }
         
         try:
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            content = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+            content = await call_ai_api(self.api_key, self.bot_name, user_prompt, system_prompt=system_prompt)
             
             # Extract optimized code
+            # Prefer the block introduced by text mentioning the optimization,
+            # otherwise fall back to the last block in the response
             optimized_code = code
-            if "```" in content:
-                code_blocks = content.split("```")
-                for i, block in enumerate(code_blocks):
-                    if i > 0 and 'optim' in code_blocks[i-1].lower():
-                        optimized_code = block.split("\n", 1)[1] if "\n" in block else block
-                        break
-                if optimized_code == code and len(code_blocks) >= 3:
-                    optimized_code = code_blocks[-2].split("\n", 1)[1] if "\n" in code_blocks[-2] else code_blocks[-2]
+            preceding_end = 0
+            for match in _FENCE_RE.finditer(content):
+                optimized_code = match.group(2)
+                if 'optim' in content[preceding_end:match.start()].lower():
+                    break
+                preceding_end = match.end()
             
+            parsed = self._parse_response(content)
             return {
                 "optimized_code": optimized_code.strip(),
                 "analysis": content,
-                "bottlenecks": self._extract_bottlenecks(content),
-                "improvements": self._extract_improvements(content),
-                "complexity_analysis": self._extract_complexity(content),
+                "bottlenecks": parsed["bottlenecks"],
+                "improvements": parsed["improvements"],
+                "complexity_analysis": parsed["complexity_analysis"],
                 "performance_gain": "Estimated 20-50% improvement based on optimizations"
             }
         except Exception as e:
@@ -1043,37 +1657,34 @@ Analyze the code and provide:
                 "performance_gain": "N/A"
             }
     
-    def _extract_bottlenecks(self, content: str) -> List[str]:
-        """Extract performance bottlenecks"""
-        bottlenecks = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['bottleneck', 'slow', 'inefficient', 'expensive', 'complexity']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    bottlenecks.append(cleaned)
-        return bottlenecks[:7]
-    
-    def _extract_improvements(self, content: str) -> List[str]:
-        """Extract improvement suggestions"""
-        improvements = []
-        lines = content.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            if any(word in line_lower for word in ['optim', 'improve', 'faster', 'cache', 'index', 'algorithm']):
-                cleaned = line.strip().lstrip('-â€¢*0123456789. ')
-                if cleaned and len(cleaned) > 10:
-                    improvements.append(cleaned)
-        return improvements[:8]
-    
-    def _extract_complexity(self, content: str) -> str:
-        """Extract complexity analysis"""
-        lines = content.split('\n')
-        for line in lines:
-            if 'O(' in line or 'complexity' in line.lower():
-                return line.strip()
-        return "Complexity analysis not available"
+    def _parse_response(self, content: str) -> Dict[str, Any]:
+        """
+        Extract bottlenecks, improvements and the complexity summary in one
+        pass over the analysis lines
+        """
+        bottlenecks: List[str] = []
+        improvements: List[str] = []
+        complexity = None
+        for line in content.splitlines():
+            stripped = line.strip()
+            if complexity is None and _COMPLEXITY_RE.search(stripped):
+                complexity = stripped
+            
+            is_bottleneck = len(bottlenecks) < 7 and _BOTTLENECK_RE.search(stripped) is not None
+            is_improvement = len(improvements) < 8 and _IMPROVEMENT_RE.search(stripped) is not None
+            if is_bottleneck or is_improvement:
+                cleaned = _BULLET_PREFIX_RE.sub("", stripped)
+                if len(cleaned) > 10:
+                    if is_bottleneck:
+                        bottlenecks.append(cleaned)
+                    if is_improvement:
+                        improvements.append(cleaned)
+        
+        return {
+            "bottlenecks": bottlenecks,
+            "improvements": improvements,
+            "complexity_analysis": complexity or "Complexity analysis not available"
+        }
 
 
 class DocumentationGenerator:
@@ -1081,27 +1692,18 @@ class DocumentationGenerator:
     AI-powered documentation generator
     """
     
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
-        
-        if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
-        else:
-            pass  # Groq/OpenAI API configured
+    __slots__ = ("api_key", "bot_name")
     
-    async def generate_docs(self, code: str, language: str, doc_type: str = "comprehensive") -> Dict[str, Any]:
-        """Generate comprehensive documentation for code"""
-        doc_types = {
-            "comprehensive": "Full documentation with examples and API references",
-            "inline": "Inline code comments and docstrings",
-            "api": "API documentation in OpenAPI/Swagger format",
-            "readme": "README documentation for the project",
-            "tutorial": "Tutorial-style documentation with examples"
-        }
-        
-        system_prompt = f"""You are a technical documentation expert for {language}.
-Generate {doc_types.get(doc_type, 'comprehensive documentation')} including:
+    DOC_TYPES = {
+        "comprehensive": "Full documentation with examples and API references",
+        "inline": "Inline code comments and docstrings",
+        "api": "API documentation in OpenAPI/Swagger format",
+        "readme": "README documentation for the project",
+        "tutorial": "Tutorial-style documentation with examples"
+    }
+    
+    SYSTEM_PROMPT = """You are a technical documentation expert for {language}.
+Generate {doc_description} including:
 1. Overview and purpose
 2. Function/class descriptions
 3. Parameter documentation
@@ -1112,6 +1714,18 @@ Generate {doc_types.get(doc_type, 'comprehensive documentation')} including:
 8. Best practices
 
 Follow {language} documentation conventions (JSDoc, docstrings, JavaDoc, etc.)."""
+    
+    def __init__(self):
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
+    
+    async def generate_docs(self, code: str, language: str, doc_type: str = "comprehensive") -> Dict[str, Any]:
+        """Generate comprehensive documentation for code"""
+        system_prompt = _render_prompt(
+            self.SYSTEM_PROMPT,
+            language=language,
+            doc_description=self.DOC_TYPES.get(doc_type, 'comprehensive documentation')
+        )
 
         user_prompt = f"Generate documentation for this {language} code:\n```{language}\n{code}\n```"
         
@@ -1123,18 +1737,15 @@ Follow {language} documentation conventions (JSDoc, docstrings, JavaDoc, etc.)."
             }
         
         try:
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            content = await call_ai_api(self.api_key, self.bot_name, full_prompt)
+            content = await call_ai_api(self.api_key, self.bot_name, user_prompt, system_prompt=system_prompt)
             
             # Extract documented code if present
             documented_code = code
-            if "```" in content:
-                code_blocks = content.split("```")
-                if len(code_blocks) >= 3:
-                    for i, block in enumerate(code_blocks):
-                        if language.lower() in code_blocks[i].lower():
-                            documented_code = block.split("\n", 1)[1] if "\n" in block else block
-                            break
+            language_lower = language.lower()
+            for match in _FENCE_RE.finditer(content):
+                if language_lower in (match.group(1) or "").lower() or language_lower in match.group(2).lower():
+                    documented_code = match.group(2)
+                    break
             
             return {
                 "documentation": content,
@@ -1154,13 +1765,7 @@ Follow {language} documentation conventions (JSDoc, docstrings, JavaDoc, etc.)."
     
     def _extract_examples(self, content: str) -> List[str]:
         """Extract code examples from documentation"""
-        examples = []
-        if "```" in content:
-            blocks = content.split("```")
-            for i, block in enumerate(blocks):
-                if i % 2 == 1:  # Odd indices are code blocks
-                    examples.append(block.strip())
-        return examples[:5]
+        return [block.strip() for block in _extract_code_blocks(content)[:5]]
 
 
 class AIAssistant:
@@ -1169,19 +1774,33 @@ class AIAssistant:
     Provides context-aware responses about programming, debugging, and best practices
     """
     
+    __slots__ = ("api_key", "bot_name", "conversation_history")
+    
+    SYSTEM_PROMPT = """You are an expert AI coding assistant integrated into a development environment.
+You help developers with:
+- Writing and explaining code in any programming language
+- Debugging and troubleshooting issues
+- Best practices and design patterns
+- Performance optimization
+- Security recommendations
+- Code review feedback
+- Learning programming concepts
+
+Provide clear, practical, and actionable responses. Include code examples when relevant.
+Format your responses with markdown for better readability."""
+    
     def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
+        self.api_key = get_api_key()
+        self.bot_name = BOT_NAME
         
         if self.api_key:
-            self.bot_name = "Claude-3-Opus"  # Poe bot
-            pass  # Using Groq/OpenAI API
             print("âœ“ AI Assistant initialized with Gemini 2.0 Flash")
         else:
             print("ERROR: Poe API key not configured for AI Assistant")
-            pass  # Poe API configured
         
         # Conversation history for context
-        self.conversation_history: List[Dict[str, str]] = []
+        # Only the last 10 messages are kept; older ones drop off as new ones arrive
+        self.conversation_history: Deque[Dict[str, str]] = deque(maxlen=10)
     
     async def chat(
         self, 
@@ -1209,36 +1828,26 @@ class AIAssistant:
             }
         
         try:
-            # Build system context
-            system_context = """You are an expert AI coding assistant integrated into a development environment.
-You help developers with:
-- Writing and explaining code in any programming language
-- Debugging and troubleshooting issues
-- Best practices and design patterns
-- Performance optimization
-- Security recommendations
-- Code review feedback
-- Learning programming concepts
-
-Provide clear, practical, and actionable responses. Include code examples when relevant.
-Format your responses with markdown for better readability."""
-
+            # Build conversation prompt; the fixed SYSTEM_PROMPT goes in the
+            # system message so only the per-request part changes between calls
+            prompt = f"User: {message}\n\nAssistant:"
+            
             # Add user context if provided
             if context:
-                context_str = "\n\nCurrent Context:\n"
-                if context.get("language"):
-                    context_str += f"- Language: {context['language']}\n"
+                language = context.get("language") or ""
+                parts = ["Current Context:"]
+                if language:
+                    parts.append(f"- Language: {language}")
                 if context.get("code"):
-                    context_str += f"- Code Snippet:\n```{context.get('language', '')}\n{context['code']}\n```\n"
+                    parts.append(f"- Code Snippet:\n```{language}\n{context['code']}\n```")
                 if context.get("file_type"):
-                    context_str += f"- File Type: {context['file_type']}\n"
-                system_context += context_str
-            
-            # Build conversation prompt
-            prompt = f"{system_context}\n\nUser: {message}\n\nAssistant:"
+                    parts.append(f"- File Type: {context['file_type']}")
+                parts.append("")
+                parts.append(prompt)
+                prompt = "\n".join(parts)
             
             # Generate response
-            content = await call_ai_api(self.api_key, self.bot_name, prompt)
+            content = await call_ai_api(self.api_key, self.bot_name, prompt, system_prompt=self.SYSTEM_PROMPT)
             
             content = content.strip()
             
@@ -1248,22 +1857,19 @@ Format your responses with markdown for better readability."""
             # Extract suggestions
             suggestions = self._extract_suggestions(content)
             
-            # Add to conversation history
+            # Add to conversation history; both turns share one timestamp
+            now = datetime.now(timezone.utc).isoformat()
             self.conversation_history.append({
                 "role": "user",
                 "content": message,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": now
             })
             self.conversation_history.append({
                 "role": "assistant",
                 "content": content,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": now
             })
             
-            # Keep only last 10 messages
-            if len(self.conversation_history) > 10:
-                self.conversation_history = self.conversation_history[-10:]
-            
             return {
                 "response": content,
                 "suggestions": suggestions,
@@ -1282,49 +1888,32 @@ Format your responses with markdown for better readability."""
     
     def _extract_code_blocks(self, content: str) -> List[Dict[str, str]]:
         """Extract code blocks from markdown"""
-        code_blocks = []
-        if "```" in content:
-            blocks = content.split("```")
-            for i, block in enumerate(blocks):
-                if i % 2 == 1:  # Odd indices are code blocks
-                    lines = block.strip().split("\n", 1)
-                    language = lines[0].strip() if lines else ""
-                    code = lines[1] if len(lines) > 1 else block.strip()
-                    code_blocks.append({
-                        "language": language,
-                        "code": code.strip()
-                    })
-        return code_blocks
+        start = content.find("```")
+        if start < 0:
+            return []
+        return [
+            {
+                "language": (match.group(1) or "").strip(),
+                "code": match.group(2).strip()
+            }
+            for match in _FENCE_RE.finditer(content, start)
+        ]
     
     def _extract_suggestions(self, content: str) -> List[str]:
         """Extract actionable suggestions from response"""
-        suggestions = []
-        lines = content.split("\n")
-        for line in lines:
-            # Look for bullet points or numbered lists
-            stripped = line.strip()
-            if stripped.startswith(("- ", "* ", "â€¢ ")) or (len(stripped) > 2 and stripped[0].isdigit() and stripped[1] in ".):"):
-                # Remove the bullet/number
-                suggestion = stripped.lstrip("-*â€¢0123456789.): ").strip()
-                if suggestion and len(suggestion) > 10:  # Filter out very short items
-                    suggestions.append(suggestion)
-        return suggestions[:5]  # Return top 5
+        # Bullet points or numbered list items, longer than 10 characters
+        matches = itertools.islice(_SUGGESTION_RE.finditer(content), 5)  # Return top 5
+        return [match.group(1) for match in matches]
     
     def _extract_references(self, content: str) -> List[str]:
         """Extract reference links or documentation mentions"""
-        references = []
-        # Look for common documentation patterns
-        keywords = ["documentation", "docs", "reference", "learn more", "see also", "read about"]
-        lines = content.split("\n")
-        for line in lines:
-            lower_line = line.lower()
-            if any(keyword in lower_line for keyword in keywords):
-                references.append(line.strip())
-        return references[:3]
+        # Lines mentioning common documentation patterns
+        matches = itertools.islice(_REFERENCE_RE.finditer(content), 3)
+        return [match.group(0).strip() for match in matches]
     
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
 
 
 
@@ -3,33 +3,75 @@ Database models and configuration
 PostgreSQL with SQLAlchemy ORM
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Boolean, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from datetime import datetime
+import asyncio
+import json
 import os
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False  # JSON columns fall back to the json module
+
 # Database URL from environment variable
 DATABASE_URL = os.getenv(
     "DATABASE_URL", 
     "sqlite:///./devcopilot.db"  # Default to SQLite for development
 )
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+# Async drivers, so database I/O never blocks the event loop or a worker thread
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Connection pool sizing (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+
+
+def get_async_database_url(url: str) -> str:
+    """Point a plain DATABASE_URL (e.g. postgresql://...) at its async driver"""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+def _json_serializer(value) -> str:
+    """Serialize a JSON column value (orjson when installed)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value)
+
+
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads if ORJSON_AVAILABLE else json.loads,
+    **({} if ASYNC_DATABASE_URL.startswith("sqlite") else {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+    })
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False,bind=engine)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Binary JSONB on PostgreSQL (parsed once on write, GIN-indexable); plain JSON elsewhere
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 
-def get_db():
+async def get_db():
     """Get database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # Database models
@@ -59,7 +101,12 @@ class CodeSnippet(Base):
     explanation = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     user_id = Column(String(100))
-    extra_metadata = Column(JSON)
+    extra_metadata = Column(JSONType)
+    
+    # "This user's recent snippets" is an index range scan instead of a table scan
+    __table_args__ = (
+        Index("ix_code_snippets_user_created", user_id, created_at.desc()),
+    )
 
 
 class UserPreference(Base):
@@ -68,7 +115,7 @@ class UserPreference(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(100), unique=True, nullable=False)
-    preferences = Column(JSON)
+    preferences = Column(JSONType)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -83,8 +130,12 @@ class DebugSession(Base):
     fixed_code = Column(Text)
     language = Column(String(50))
     error_message = Column(Text)
-    suggestions = Column(JSON)
+    suggestions = Column(JSONType)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_debug_sessions_user_created", user_id, created_at.desc()),
+    )
 
 
 class SecurityScan(Base):
@@ -95,18 +146,27 @@ class SecurityScan(Base):
     user_id = Column(String(100))
     code = Column(Text, nullable=False)
     language = Column(String(50))
-    vulnerabilities = Column(JSON)
-    severity_summary = Column(JSON)
+    vulnerabilities = Column(JSONType)
+    severity_summary = Column(JSONType)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_security_scans_user_created", user_id, created_at.desc()),
+        # Containment queries on findings (vulnerabilities @> ...) on PostgreSQL only
+        Index(
+            "ix_security_scans_vulnerabilities_gin", vulnerabilities, postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
 
 
 # Create all tables
-def init_db():
+async def init_db():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
 
 if __name__ == "__main__":
     print("Initializing database...")
-    init_db()
+    asyncio.run(init_db())
     print("Database initialized successfully!")
@@ -3,12 +3,111 @@ GitHub Integration for automated Pull Requests
 """
 
 import os
-from typing import Dict, List, Optional
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 import httpx
 from datetime import datetime
 
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False  # Clients stay on HTTP/1.1 keep-alive
 
-class GitHubIntegration:
+# Pooled connections shared by every call an integration makes
+HTTP_LIMITS = httpx.Limits(max_connections=40, max_keepalive_connections=20)
+HTTP_TIMEOUT = httpx.Timeout(30.0)
+
+# Concurrent GitHub blob uploads per commit (GitHub asks integrations to keep this low)
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "10"))
+
+# Retries for rate-limited (403/429) API calls, honouring Retry-After; waits
+# longer than GITHUB_MAX_RETRY_WAIT seconds are not worth holding a request for
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+GITHUB_MAX_RETRY_WAIT = 60.0
+
+# Conditional-GET cache for GitHub reads: a fresh entry is served without a
+# request, a stale one is revalidated with If-None-Match (304s cost no quota)
+GITHUB_CACHE_TTL = int(os.getenv("GITHUB_CACHE_TTL", "60"))
+GITHUB_CACHE_SIZE = 256
+
+
+def _is_rate_limited(response: httpx.Response) -> bool:
+    """True for 429s and for 403s caused by an exhausted (or secondary) rate limit"""
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and (
+        response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers
+    )
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying a rate-limited response"""
+    try:
+        return float(int(response.headers["Retry-After"], 10))
+    except (KeyError, ValueError):
+        pass
+    try:
+        return max(0.0, int(response.headers["X-RateLimit-Reset"], 10) - time.time())
+    except (KeyError, ValueError):
+        return min(8.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class _PooledAPIClient:
+    """
+    Pooled httpx client with rate-limit retries, shared by the Git hosting integrations
+    """
+    
+    def __init__(self, headers: Dict[str, str]):
+        self.headers = headers
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Return this integration's pooled AsyncClient, created on first use
+        (and rebuilt if the event loop changed, since connections are loop-bound)
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers=self.headers, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_AVAILABLE
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def aclose(self):
+        """Close the pooled AsyncClient (call on application shutdown)"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send an API request, retrying rate-limited responses
+        
+        A 429, or a 403 whose rate-limit quota is exhausted, is retried after
+        Retry-After (or X-RateLimit-Reset) seconds, falling back to exponential
+        backoff with jitter. The last response is returned once GITHUB_MAX_RETRIES
+        retries are used up, or when the server asks for a longer wait.
+        """
+        client = self._get_client()
+        for attempt in range(GITHUB_MAX_RETRIES + 1):
+            response = await client.request(method, url, **kwargs)
+            if attempt == GITHUB_MAX_RETRIES or not _is_rate_limited(response):
+                return response
+            delay = _retry_delay(response, attempt)
+            if delay > GITHUB_MAX_RETRY_WAIT:
+                return response
+            await asyncio.sleep(delay)
+        return response
+
+
+class GitHubIntegration(_PooledAPIClient):
     """
     Automate GitHub operations including PR creation
     """
@@ -16,10 +115,44 @@ class GitHubIntegration:
     def __init__(self):
         self.token = os.getenv("GITHUB_TOKEN")
         self.base_url = "https://api.github.com"
-        self.headers = {
+        self._repos_url = f"{self.base_url}/repos"
+        super().__init__({
             "Authorization": f"token {self.token}",
             "Accept": "application/vnd.github.v3+json"
-        }
+        })
+        # url + params -> (etag, body, fresh until)
+        self._etag_cache: "OrderedDict[str, Tuple[str, Any, float]]" = OrderedDict()
+    
+    async def _cached_get(self, url: str, params: Optional[Dict[str, str]] = None, ttl: int = GITHUB_CACHE_TTL) -> Any:
+        """
+        GET a GitHub resource and return its JSON body, using the ETag cache
+        
+        ttl=0 always revalidates, for reads that must never be stale.
+        """
+        key = str(httpx.URL(url, params=params))
+        cached = self._etag_cache.get(key)
+        if cached is not None and cached[2] > time.monotonic():
+            self._etag_cache.move_to_end(key)
+            return cached[1]
+        
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        response = await self._request("GET", url, params=params, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            body = cached[1]
+            etag = cached[0]
+        else:
+            response.raise_for_status()
+            body = response.json()
+            etag = response.headers.get("ETag")
+            if etag is None:
+                self._etag_cache.pop(key, None)
+                return body
+        
+        self._etag_cache[key] = (etag, body, time.monotonic() + ttl)
+        self._etag_cache.move_to_end(key)
+        if len(self._etag_cache) > GITHUB_CACHE_SIZE:
+            self._etag_cache.popitem(last=False)
+        return body
     
     async def create_pull_request(
         self,
@@ -46,11 +179,11 @@ class GitHubIntegration:
         """
         
         if code_changes:
-            # First, create or update files
-            await self._commit_files(repo, head_branch, code_changes)
+            # First, commit all the files to the head branch
+            await self._commit_files_tree(repo, head_branch, code_changes)
         
         # Create pull request
-        url = f"{self.base_url}/repos/{repo}/pulls"
+        url = f"{self._repos_url}/{repo}/pulls"
         
         data = {
             "title": title,
@@ -59,58 +192,70 @@ class GitHubIntegration:
             "base": base_branch
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=data)
-            response.raise_for_status()
-            
-            pr_data = response.json()
-            
-            return {
-                "number": pr_data["number"],
-                "url": pr_data["html_url"],
-                "state": pr_data["state"],
-                "created_at": pr_data["created_at"]
-            }
+        response = await self._request("POST", url, json=data)
+        response.raise_for_status()
+        
+        pr_data = response.json()
+        
+        return {
+            "number": pr_data["number"],
+            "url": pr_data["html_url"],
+            "state": pr_data["state"],
+            "created_at": pr_data["created_at"]
+        }
     
-    async def _commit_files(
+    async def _commit_files_tree(
         self,
         repo: str,
         branch: str,
         files: Dict[str, str],
         commit_message: str = "AI-generated code updates"
-    ):
+    ) -> str:
+        """
+        Commit files to a repository branch as a single commit
+        
+        Uses the Git Data API (blobs, one tree, one commit, ref update), so the
+        request count no longer doubles with the number of files and the blobs
+        can be uploaded concurrently. Returns the new commit SHA.
         """
-        Commit files to a repository branch
-        """
-        async with httpx.AsyncClient() as client:
-            for file_path, content in files.items():
-                # Get file SHA if it exists (for updates)
-                url = f"{self.base_url}/repos/{repo}/contents/{file_path}?ref={branch}"
-                
-                try:
-                    response = await client.get(url, headers=self.headers)
-                    existing_file = response.json()
-                    sha = existing_file.get("sha")
-                except:
-                    sha = None
-                
-                # Create or update file
-                url = f"{self.base_url}/repos/{repo}/contents/{file_path}"
-                
-                import base64
-                encoded_content = base64.b64encode(content.encode()).decode()
-                
-                data = {
-                    "message": commit_message,
-                    "content": encoded_content,
-                    "branch": branch
-                }
-                
-                if sha:
-                    data["sha"] = sha
-                
-                response = await client.put(url, headers=self.headers, json=data)
-                response.raise_for_status()
+        git_url = f"{self._repos_url}/{repo}/git"
+        
+        # Current head of the branch and the tree it points at
+        head_sha = (await self._cached_get(f"{git_url}/refs/heads/{branch}", ttl=0))["object"]["sha"]
+        base_tree = (await self._cached_get(f"{git_url}/commits/{head_sha}"))["tree"]["sha"]
+        
+        semaphore = asyncio.Semaphore(GITHUB_MAX_CONCURRENCY)
+        
+        async def create_blob(content: str) -> str:
+            async with semaphore:
+                response = await self._request("POST", f"{git_url}/blobs", json={"content": content, "encoding": "utf-8"})
+            response.raise_for_status()
+            return response.json()["sha"]
+        
+        blob_shas = await asyncio.gather(*(create_blob(content) for content in files.values()))
+        
+        response = await self._request("POST", f"{git_url}/trees", json={
+            "base_tree": base_tree,
+            "tree": [
+                {"path": file_path, "mode": "100644", "type": "blob", "sha": sha}
+                for file_path, sha in zip(files, blob_shas)
+            ]
+        })
+        response.raise_for_status()
+        tree_sha = response.json()["sha"]
+        
+        response = await self._request("POST", f"{git_url}/commits", json={
+            "message": commit_message,
+            "tree": tree_sha,
+            "parents": [head_sha]
+        })
+        response.raise_for_status()
+        commit_sha = response.json()["sha"]
+        
+        response = await self._request("PATCH", f"{git_url}/refs/heads/{branch}", json={"sha": commit_sha})
+        response.raise_for_status()
+        
+        return commit_sha
     
     async def get_pull_requests(
         self,
@@ -120,14 +265,10 @@ class GitHubIntegration:
         """
         Get pull requests for a repository
         """
-        url = f"{self.base_url}/repos/{repo}/pulls"
+        url = f"{self._repos_url}/{repo}/pulls"
         params = {"state": state}
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            
-            return response.json()
+        return await self._cached_get(url, params=params)
     
     async def create_branch(
         self,
@@ -138,24 +279,21 @@ class GitHubIntegration:
         """
         Create a new branch
         """
-        async with httpx.AsyncClient() as client:
-            # Get the SHA of the from_branch
-            url = f"{self.base_url}/repos/{repo}/git/refs/heads/{from_branch}"
-            response = await client.get(url, headers=self.headers)
-            response.raise_for_status()
-            sha = response.json()["object"]["sha"]
-            
-            # Create new branch
-            url = f"{self.base_url}/repos/{repo}/git/refs"
-            data = {
-                "ref": f"refs/heads/{branch_name}",
-                "sha": sha
-            }
-            
-            response = await client.post(url, headers=self.headers, json=data)
-            response.raise_for_status()
-            
-            return response.json()
+        # Get the SHA of the from_branch (revalidated every time, so never stale)
+        url = f"{self._repos_url}/{repo}/git/refs/heads/{from_branch}"
+        sha = (await self._cached_get(url, ttl=0))["object"]["sha"]
+        
+        # Create new branch
+        url = f"{self._repos_url}/{repo}/git/refs"
+        data = {
+            "ref": f"refs/heads/{branch_name}",
+            "sha": sha
+        }
+        
+        response = await self._request("POST", url, json=data)
+        response.raise_for_status()
+        
+        return response.json()
     
     async def add_pr_comment(
         self,
@@ -166,17 +304,16 @@ class GitHubIntegration:
         """
         Add a comment to a pull request
         """
-        url = f"{self.base_url}/repos/{repo}/issues/{pr_number}/comments"
+        url = f"{self._repos_url}/{repo}/issues/{pr_number}/comments"
         data = {"body": comment}
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=data)
-            response.raise_for_status()
-            
-            return response.json()
+        response = await self._request("POST", url, json=data)
+        response.raise_for_status()
+        
+        return response.json()
 
 
-class GitLabIntegration:
+class GitLabIntegration(_PooledAPIClient):
     """
     GitLab integration for merge requests
     """
@@ -184,9 +321,9 @@ class GitLabIntegration:
     def __init__(self):
         self.token = os.getenv("GITLAB_TOKEN")
         self.base_url = os.getenv("GITLAB_URL", "https://gitlab.com")
-        self.headers = {
+        super().__init__({
             "PRIVATE-TOKEN": self.token
-        }
+        })
     
     async def create_merge_request(
         self,
@@ -208,8 +345,7 @@ class GitLabIntegration:
             "target_branch": target_branch
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=data)
-            response.raise_for_status()
-            
-            return response.json()
+        response = await self._request("POST", url, json=data)
+        response.raise_for_status()
+        
+        return response.json()
@@ -6,14 +6,27 @@ FastAPI server with AI integration for code generation, debugging, and security
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables from .env file
 
-from fastapi import FastAPI, WebSocket, HTTPException, Depends
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, BackgroundTasks, Query, Request
+from starlette.requests import HTTPConnection
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+import anyio.to_thread
 import asyncio
 import json
+import os
 from datetime import datetime
+from enum import Enum
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False  # Responses and websocket frames use the json module
 
 from ai_engine import (
     CodeGenerator, 
@@ -24,26 +37,60 @@ from ai_engine import (
     TestGenerator,
     PerformanceOptimizer,
     DocumentationGenerator,
-    AIAssistant
+    AIAssistant,
+    close_http_client
 )
 from database import SessionLocal, get_db, User
 from models import CodeSnippet, UserPreference
 from vector_search import VectorStore
-from database import init_db
+from database import init_db, engine
 
 app = FastAPI(
     title="Smart DevCopilot API",
     description="AI-Powered Coding Assistant Backend",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson encodes response bodies straight to bytes, several times faster
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
 )
 
+# Worker threads for blocking work (sync dependencies, asyncio.to_thread offloads).
+# The defaults (40 anyio tokens, cpu_count + 4 executor threads) are sized for CPU work,
+# not for I/O-bound calls that mostly wait on the network.
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", (os.cpu_count() or 1) * 5))
+
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on startup"""
-    init_db()
+    """Initialize worker thread pools, AI components and database tables on startup"""
+    app.state.executor = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE)
+    asyncio.get_running_loop().set_default_executor(app.state.executor)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREAD_POOL_SIZE
+    
+    # Constructors may load models or read index files, so build them in
+    # worker threads, alongside the database setup
+    instances, _ = await asyncio.gather(
+        asyncio.gather(*(asyncio.to_thread(factory) for factory in COMPONENTS.values())),
+        init_db()
+    )
+    for name, instance in zip(COMPONENTS, instances):
+        setattr(app.state, name, instance)
     print("✅ Database initialized successfully!")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Save pending vector snippets and release the AI HTTP and database pools and the worker threads"""
+    # Startup may have failed before the components (or the executor) were set
+    vector_store = getattr(app.state, "vector_store", None)
+    if vector_store is not None:
+        await vector_store.flush()
+    await close_http_client()
+    await engine.dispose()
+    executor = getattr(app.state, "executor", None)
+    if executor is not None:
+        executor.shutdown(wait=False)
+
 # CORS middleware for IDE integration
 app.add_middleware(
     CORSMiddleware,
@@ -53,17 +100,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize AI components
-code_generator = CodeGenerator()
-debug_analyzer = DebugAnalyzer()
-security_scanner = SecurityScanner()
-vector_store = VectorStore()
-code_reviewer = CodeReviewer()
-code_refactorer = CodeRefactorer()
-test_generator = TestGenerator()
-performance_optimizer = PerformanceOptimizer()
-documentation_generator = DocumentationGenerator()
-ai_assistant = AIAssistant()
+
+class GZipExceptStreamsMiddleware(GZipMiddleware):
+    """GZip responses, except the /stream endpoints (gzip would hold their chunks back)"""
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+# Compress large bodies (code, fixed_code, reviews) on the wire
+app.add_middleware(GZipExceptStreamsMiddleware, minimum_size=1024)
+
+# Upper bound on raw code uploads to the /raw endpoints
+MAX_CODE_BYTES = int(os.getenv("MAX_CODE_BYTES", str(10 * 1024 * 1024)))
+
+# AI components, built concurrently on startup and stored on app.state;
+# handlers receive them through component(name)
+COMPONENTS = {
+    "code_generator": CodeGenerator,
+    "debug_analyzer": DebugAnalyzer,
+    "security_scanner": SecurityScanner,
+    "vector_store": VectorStore,
+    "code_reviewer": CodeReviewer,
+    "code_refactorer": CodeRefactorer,
+    "test_generator": TestGenerator,
+    "performance_optimizer": PerformanceOptimizer,
+    "documentation_generator": DocumentationGenerator,
+    "ai_assistant": AIAssistant,
+}
+
+
+def component(name: str):
+    """Dependency returning the startup-built AI component `name`"""
+    def get_component(connection: HTTPConnection):
+        return getattr(connection.app.state, name)
+    return Depends(get_component)
+
+
+# Fixed choices, validated by enum lookup. Request `language` fields stay plain
+# strings, since editors send their own language IDs (e.g. "typescriptreact").
+class Language(str, Enum):
+    python = "python"
+    javascript = "javascript"
+    typescript = "typescript"
+    java = "java"
+    csharp = "csharp"
+    go = "go"
+    rust = "rust"
+    cpp = "cpp"
+    ruby = "ruby"
+    php = "php"
+    swift = "swift"
+    kotlin = "kotlin"
+
+
+class RefactorType(str, Enum):
+    general = "general"
+    performance = "performance"
+    clean_code = "clean_code"
+    design_patterns = "design_patterns"
+    simplify = "simplify"
+
+
+class DocType(str, Enum):
+    comprehensive = "comprehensive"
+    inline = "inline"
+    api = "api"
+    readme = "readme"
+    tutorial = "tutorial"
 
 
 # Pydantic models
@@ -86,6 +193,13 @@ class SecurityScanRequest(BaseModel):
     file_path: Optional[str] = None
 
 
+class FullAnalysisRequest(BaseModel):
+    code: str
+    language: str
+    error_message: Optional[str] = None
+    context: Optional[str] = None
+
+
 class CodeReviewRequest(BaseModel):
     code: str
     language: str
@@ -95,7 +209,7 @@ class CodeReviewRequest(BaseModel):
 class RefactorRequest(BaseModel):
     code: str
     language: str
-    refactor_type: str = "general"  # general, performance, clean_code, design_patterns, simplify
+    refactor_type: RefactorType = RefactorType.general
 
 
 class TestGenerationRequest(BaseModel):
@@ -113,7 +227,7 @@ class OptimizationRequest(BaseModel):
 class DocumentationRequest(BaseModel):
     code: str
     language: str
-    doc_type: str = "comprehensive"  # comprehensive, inline, api, readme, tutorial
+    doc_type: DocType = DocType.comprehensive
 
 
 class ChatRequest(BaseModel):
@@ -153,39 +267,80 @@ class SecurityResponse(BaseModel):
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+    async def send_personal_message(self, message: bytes, websocket: WebSocket, binary: bool = True):
+        """Send encoded JSON as a binary frame, or as text for text-frame clients"""
+        if binary:
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message.decode())
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        """Send to every client concurrently, dropping clients whose send failed"""
+        # Snapshot, since clients can disconnect while we await their sends
+        connections = tuple(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(message) for connection in connections),
+            return_exceptions=True
+        )
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection)
 
 
 manager = ConnectionManager()
 
 
+def _ws_dumps(payload: Dict[str, Any]) -> bytes:
+    """Encode a websocket reply as UTF-8 JSON"""
+    return orjson.dumps(payload) if ORJSON_AVAILABLE else json.dumps(payload).encode()
+
+
+def _ws_loads(data):
+    """Decode a websocket message from a text or binary frame"""
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+
+# Static response bodies, encoded once at import instead of on every request.
+# The health check only splices in its timestamp (ISO strings need no escaping).
+_HEALTH_PREFIX = json.dumps({
+    "status": "online",
+    "service": "Smart DevCopilot API",
+    "version": "1.0.0",
+})[:-1].encode() + b', "timestamp": "'
+_LANGUAGES_BODY = json.dumps({"languages": [language.value for language in Language]}).encode()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {
-        "status": "online",
-        "service": "Smart DevCopilot API",
-        "version": "1.0.0",
-        "timestamp": datetime.now().isoformat()
-    }
+    content = _HEALTH_PREFIX + datetime.now().isoformat().encode() + b'"}'
+    return Response(content=content, media_type="application/json")
+
+
+async def _store_snippet_in_background(vector_store: VectorStore, **snippet):
+    """Index a generated snippet after the response is sent; failures are only logged"""
+    try:
+        await vector_store.store_snippet(**snippet)
+    except Exception as e:
+        print(f"Failed to store snippet for semantic search: {e}")
 
 
 @app.post("/api/generate", response_model=CodeGenerationResponse)
-async def generate_code(request: CodeGenerationRequest):
+async def generate_code(
+    request: CodeGenerationRequest,
+    background_tasks: BackgroundTasks,
+    code_generator: CodeGenerator = component("code_generator"),
+    vector_store: VectorStore = component("vector_store")
+):
     """
     Generate code from natural language description
     Example: "Build a REST API for customer data"
@@ -199,8 +354,10 @@ async def generate_code(request: CodeGenerationRequest):
             max_tokens=request.max_tokens
         )
         
-        # Store in vector database for semantic search
-        await vector_store.store_snippet(
+        # Store in vector database for semantic search, once the response is sent
+        background_tasks.add_task(
+            _store_snippet_in_background,
+            vector_store,
             code=result["code"],
             description=request.prompt,
             language=request.language
@@ -216,8 +373,29 @@ async def generate_code(request: CodeGenerationRequest):
         raise HTTPException(status_code=500, detail=f"Code generation failed: {str(e)}")
 
 
+@app.post("/api/generate/stream")
+async def generate_code_stream(
+    request: CodeGenerationRequest,
+    code_generator: CodeGenerator = component("code_generator")
+):
+    """
+    Stream generated code as plain text while the model is still writing it
+    """
+    return StreamingResponse(
+        code_generator.generate_stream(
+            prompt=request.prompt,
+            language=request.language,
+            context=request.context
+        ),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 @app.post("/api/debug", response_model=DebugResponse)
-async def debug_code(request: DebugRequest):
+async def debug_code(
+    request: DebugRequest,
+    debug_analyzer: DebugAnalyzer = component("debug_analyzer")
+):
     """
     Analyze code and provide debugging suggestions with explanations
     """
@@ -238,8 +416,29 @@ async def debug_code(request: DebugRequest):
         raise HTTPException(status_code=500, detail=f"Debug analysis failed: {str(e)}")
 
 
+@app.post("/api/debug/stream")
+async def debug_code_stream(
+    request: DebugRequest,
+    debug_analyzer: DebugAnalyzer = component("debug_analyzer")
+):
+    """
+    Stream the debugging analysis as plain text while the model is still writing it
+    """
+    return StreamingResponse(
+        debug_analyzer.analyze_stream(
+            code=request.code,
+            language=request.language,
+            error_message=request.error_message
+        ),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 @app.post("/api/security-scan", response_model=SecurityResponse)
-async def scan_security(request: SecurityScanRequest):
+async def scan_security(
+    request: SecurityScanRequest,
+    security_scanner: SecurityScanner = component("security_scanner")
+):
     """
     Detect security vulnerabilities in code as you type
     """
@@ -259,8 +458,59 @@ async def scan_security(request: SecurityScanRequest):
         raise HTTPException(status_code=500, detail=f"Security scan failed: {str(e)}")
 
 
+async def _read_code_body(http_request: Request) -> str:
+    """Read a raw request body (the code itself) as UTF-8, enforcing MAX_CODE_BYTES"""
+    body = bytearray()
+    async for chunk in http_request.stream():
+        body += chunk
+        if len(body) > MAX_CODE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Code exceeds {MAX_CODE_BYTES} bytes")
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Code must be UTF-8 encoded")
+
+
+@app.post("/api/debug/raw", response_model=DebugResponse)
+async def debug_code_raw(
+    http_request: Request,
+    language: str = Query(...),
+    error_message: Optional[str] = None,
+    debug_analyzer: DebugAnalyzer = component("debug_analyzer")
+):
+    """
+    /api/debug for large files: the body is the raw code, so it is read once
+    with no JSON escaping or parsing
+    """
+    code = await _read_code_body(http_request)
+    return await debug_code(
+        DebugRequest(code=code, language=language, error_message=error_message),
+        debug_analyzer
+    )
+
+
+@app.post("/api/security-scan/raw", response_model=SecurityResponse)
+async def scan_security_raw(
+    http_request: Request,
+    language: str = Query(...),
+    file_path: Optional[str] = None,
+    security_scanner: SecurityScanner = component("security_scanner")
+):
+    """/api/security-scan with the raw code as the request body"""
+    code = await _read_code_body(http_request)
+    return await scan_security(
+        SecurityScanRequest(code=code, language=language, file_path=file_path),
+        security_scanner
+    )
+
+
 @app.get("/api/semantic-search")
-async def semantic_search(query: str, language: Optional[str] = None, limit: int = 5):
+async def semantic_search(
+    query: str,
+    language: Optional[str] = None,
+    limit: int = 5,
+    vector_store: VectorStore = component("vector_store")
+):
     """
     Search code snippets using semantic similarity
     """
@@ -276,15 +526,26 @@ async def semantic_search(query: str, language: Optional[str] = None, limit: int
 
 
 @app.websocket("/ws/realtime")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    code_generator: CodeGenerator = component("code_generator"),
+    debug_analyzer: DebugAnalyzer = component("debug_analyzer"),
+    security_scanner: SecurityScanner = component("security_scanner")
+):
     """
     WebSocket endpoint for real-time code assistance
+    
+    Accepts JSON in text or binary frames and answers in the same frame type;
+    binary frames skip the UTF-8 text round-trip on both ends.
     """
     await manager.connect(websocket)
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            binary = frame.get("bytes") is not None
+            message = _ws_loads(frame["bytes"] if binary else frame["text"])
             
             action = message.get("action")
             
@@ -295,8 +556,9 @@ async def websocket_endpoint(websocket: WebSocket):
                     context=message.get("context")
                 )
                 await manager.send_personal_message(
-                    json.dumps({"type": "generation", "data": result}),
-                    websocket
+                    _ws_dumps({"type": "generation", "data": result}),
+                    websocket,
+                    binary
                 )
             
             elif action == "debug":
@@ -306,8 +568,9 @@ async def websocket_endpoint(websocket: WebSocket):
                     error_message=message.get("error_message")
                 )
                 await manager.send_personal_message(
-                    json.dumps({"type": "debug", "data": analysis}),
-                    websocket
+                    _ws_dumps({"type": "debug", "data": analysis}),
+                    websocket,
+                    binary
                 )
             
             elif action == "security":
@@ -316,8 +579,9 @@ async def websocket_endpoint(websocket: WebSocket):
                     language=message["language"]
                 )
                 await manager.send_personal_message(
-                    json.dumps({"type": "security", "data": scan}),
-                    websocket
+                    _ws_dumps({"type": "security", "data": scan}),
+                    websocket,
+                    binary
                 )
                 
     except Exception as e:
@@ -327,7 +591,10 @@ async def websocket_endpoint(websocket: WebSocket):
 
 
 @app.post("/api/review")
-async def review_code(request: CodeReviewRequest):
+async def review_code(
+    request: CodeReviewRequest,
+    code_reviewer: CodeReviewer = component("code_reviewer")
+):
     """
     AI-powered code review with best practices and suggestions
     """
@@ -342,8 +609,62 @@ async def review_code(request: CodeReviewRequest):
         raise HTTPException(status_code=500, detail=f"Code review failed: {str(e)}")
 
 
+@app.post("/api/review/raw")
+async def review_code_raw(
+    http_request: Request,
+    language: str = Query(...),
+    context: Optional[str] = None,
+    code_reviewer: CodeReviewer = component("code_reviewer")
+):
+    """/api/review with the raw code as the request body"""
+    code = await _read_code_body(http_request)
+    return await review_code(
+        CodeReviewRequest(code=code, language=language, context=context),
+        code_reviewer
+    )
+
+
+@app.post("/api/full-analysis")
+async def full_analysis(
+    request: FullAnalysisRequest,
+    debug_analyzer: DebugAnalyzer = component("debug_analyzer"),
+    security_scanner: SecurityScanner = component("security_scanner"),
+    code_reviewer: CodeReviewer = component("code_reviewer")
+):
+    """
+    Debug, security-scan and review code in one request, running the analyzers concurrently
+    """
+    try:
+        debug_result, security_result, review_result = await asyncio.gather(
+            debug_analyzer.analyze(
+                code=request.code,
+                language=request.language,
+                error_message=request.error_message
+            ),
+            security_scanner.scan(
+                code=request.code,
+                language=request.language
+            ),
+            code_reviewer.review(
+                code=request.code,
+                language=request.language,
+                context=request.context
+            )
+        )
+        return {
+            "debug": debug_result,
+            "security": security_result,
+            "review": review_result
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Full analysis failed: {str(e)}")
+
+
 @app.post("/api/refactor")
-async def refactor_code(request: RefactorRequest):
+async def refactor_code(
+    request: RefactorRequest,
+    code_refactorer: CodeRefactorer = component("code_refactorer")
+):
     """
     AI-powered code refactoring for better quality and maintainability
     """
@@ -351,7 +672,7 @@ async def refactor_code(request: RefactorRequest):
         refactor_result = await code_refactorer.refactor(
             code=request.code,
             language=request.language,
-            refactor_type=request.refactor_type
+            refactor_type=request.refactor_type.value
         )
         return refactor_result
     except Exception as e:
@@ -359,7 +680,10 @@ async def refactor_code(request: RefactorRequest):
 
 
 @app.post("/api/generate-tests")
-async def generate_tests(request: TestGenerationRequest):
+async def generate_tests(
+    request: TestGenerationRequest,
+    test_generator: TestGenerator = component("test_generator")
+):
     """
     AI-powered test case generation with comprehensive coverage
     """
@@ -375,7 +699,10 @@ async def generate_tests(request: TestGenerationRequest):
 
 
 @app.post("/api/optimize")
-async def optimize_code(request: OptimizationRequest):
+async def optimize_code(
+    request: OptimizationRequest,
+    performance_optimizer: PerformanceOptimizer = component("performance_optimizer")
+):
     """
     AI-powered performance optimization and analysis
     """
@@ -391,7 +718,10 @@ async def optimize_code(request: OptimizationRequest):
 
 
 @app.post("/api/generate-docs")
-async def generate_documentation(request: DocumentationRequest):
+async def generate_documentation(
+    request: DocumentationRequest,
+    documentation_generator: DocumentationGenerator = component("documentation_generator")
+):
     """
     AI-powered documentation generation
     """
@@ -399,7 +729,7 @@ async def generate_documentation(request: DocumentationRequest):
         docs_result = await documentation_generator.generate_docs(
             code=request.code,
             language=request.language,
-            doc_type=request.doc_type
+            doc_type=request.doc_type.value
         )
         return docs_result
     except Exception as e:
@@ -407,7 +737,10 @@ async def generate_documentation(request: DocumentationRequest):
 
 
 @app.post("/api/chat")
-async def chat_with_assistant(request: ChatRequest):
+async def chat_with_assistant(
+    request: ChatRequest,
+    ai_assistant: AIAssistant = component("ai_assistant")
+):
     """
     Chat with AI coding assistant
     """
@@ -423,7 +756,7 @@ async def chat_with_assistant(request: ChatRequest):
 
 
 @app.post("/api/chat/clear")
-async def clear_chat_history():
+async def clear_chat_history(ai_assistant: AIAssistant = component("ai_assistant")):
     """
     Clear conversation history
     """
@@ -439,22 +772,7 @@ async def get_supported_languages():
     """
     Get list of supported programming languages
     """
-    return {
-        "languages": [
-            "python",
-            "javascript",
-            "typescript",
-            "java",
-            "csharp",
-            "go",
-            "rust",
-            "cpp",
-            "ruby",
-            "php",
-            "swift",
-            "kotlin"
-        ]
-    }
+    return Response(content=_LANGUAGES_BODY, media_type="application/json")
 
 
 if __name__ == "__main__":
@@ -2,21 +2,87 @@
 Unit tests for Smart DevCopilot backend
 """
 
+import asyncio
+import zlib
+import httpx
+import numpy as np
 import pytest
-from fastapi.testclient import TestClient
+import pytest_asyncio
+import vector_search
 from main import app
 
-client = TestClient(app)
 
+class FakeEncoder:
+    """Bag-of-words stand-in for the embedding model, deterministic and torch-free"""
+    
+    def __init__(self, model_dir: str):
+        pass
+    
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        
+        embeddings = np.zeros((len(texts), 384), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row, zlib.crc32(word.encode()) % 384] += 1
+        embeddings[:, 0] += 1e-3  # no all-zero rows
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if single else embeddings
 
-def test_health_check():
-    """Test the health check endpoint"""
-    response = client.get("/")
-    assert response.status_code == 200
-    assert response.json()["status"] == "online"
 
+@pytest.fixture(autouse=True)
+def fake_encoder(monkeypatch, tmp_path):
+    """Embed with FakeEncoder through the ONNX hook, and keep the index files in tmp_path"""
+    monkeypatch.setattr(vector_search, "ONNX_ENCODER_ENABLED", True)
+    monkeypatch.setattr(vector_search, "OnnxEncoder", FakeEncoder)
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest_asyncio.fixture
+async def client():
+    """Async client on the ASGI app, with the startup hooks run (they build the AI components)"""
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as test_client:
+            yield test_client
+
+
+def check_health(data):
+    assert data["status"] == "online"
+
+
+def check_semantic_search(data):
+    assert "results" in data
+
+
+def check_languages(data):
+    assert "languages" in data
+    assert "python" in data["languages"]
+    assert "javascript" in data["languages"]
 
-def test_generate_code():
+
+# Read-only endpoints, requested concurrently by test_read_endpoints
+READ_ENDPOINTS = [
+    ("/", check_health),
+    ("/api/semantic-search?query=authentication&limit=5", check_semantic_search),
+    ("/api/languages", check_languages),
+]
+
+
+@pytest.mark.asyncio
+async def test_read_endpoints(client):
+    """Test the health check, semantic search and supported languages endpoints"""
+    responses = await asyncio.gather(*(client.get(path) for path, _ in READ_ENDPOINTS))
+    
+    for (path, check), response in zip(READ_ENDPOINTS, responses):
+        assert response.status_code == 200, path
+        check(response.json())
+
+
+@pytest.mark.asyncio
+async def test_generate_code(client):
     """Test code generation endpoint"""
     request_data = {
         "prompt": "Create a function to add two numbers",
@@ -24,7 +90,7 @@ def test_generate_code():
         "max_tokens": 500
     }
     
-    response = client.post("/api/generate", json=request_data)
+    response = await client.post("/api/generate", json=request_data)
     assert response.status_code == 200
     
     data = response.json()
@@ -33,64 +99,67 @@ def test_generate_code():
     assert "optimization_tips" in data
 
 
-def test_debug_code():
+@pytest.mark.asyncio
+async def test_debug_code(client):
     """Test code debugging endpoint"""
     request_data = {
         "code": "def add(a, b):\n    return a + b",
         "language": "python"
     }
     
-    response = client.post("/api/debug", json=request_data)
+    response = await client.post("/api/debug", json=request_data)
     assert response.status_code == 200
     
     data = response.json()
+    assert "analysis" in data
     assert "suggestions" in data
-    assert "explanations" in data
+    assert "severity" in data
 
 
-def test_security_scan():
+@pytest.mark.asyncio
+async def test_security_scan(client):
     """Test security scanning endpoint"""
     request_data = {
         "code": "import os\nos.system('ls -la')",
         "language": "python"
     }
     
-    response = client.post("/api/security-scan", json=request_data)
+    response = await client.post("/api/security-scan", json=request_data)
     assert response.status_code == 200
     
     data = response.json()
-    assert "vulnerabilities" in data
-    assert "severity_levels" in data
+    assert "issues" in data
+    assert "overall_risk" in data
+    assert "recommendations" in data
 
 
-def test_semantic_search():
-    """Test semantic search endpoint"""
-    response = client.get("/api/semantic-search?query=authentication&limit=5")
-    assert response.status_code == 200
+@pytest.mark.asyncio
+async def test_full_analysis(client):
+    """Test combined debug, security and review endpoint"""
+    request_data = {
+        "code": "data = input()\nresult = eval(data)",
+        "language": "python"
+    }
     
-    data = response.json()
-    assert "results" in data
-
-
-def test_supported_languages():
-    """Test supported languages endpoint"""
-    response = client.get("/api/languages")
+    response = await client.post("/api/full-analysis", json=request_data)
     assert response.status_code == 200
     
     data = response.json()
-    assert "languages" in data
-    assert "python" in data["languages"]
-    assert "javascript" in data["languages"]
+    assert "debug" in data
+    assert "security" in data
+    assert "review" in data
+    assert data["security"]["issues"][0]["line"] == 2
 
 
-def test_invalid_code_generation():
+@pytest.mark.asyncio
+async def test_invalid_code_generation(client):
     """Test error handling for invalid requests"""
     request_data = {
         "prompt": "",  # Empty prompt
         "language": "python"
     }
     
-    response = client.post("/api/generate", json=request_data)
+    response = await client.post("/api/generate", json=request_data)
     # Should handle gracefully
     assert response.status_code in [200, 400, 500]
 
@@ -122,6 +191,58 @@ async def test_vector_store():
     assert len(results) > 0
 
 
+@pytest.mark.asyncio
+async def test_vector_store_tiers(monkeypatch):
+    """Test the index moves from exact search to HNSW to IVF-PQ as the corpus grows"""
+    from vector_search import VectorStore
+    
+    monkeypatch.setattr(vector_search, "FAISS_HNSW_THRESHOLD", 40)
+    monkeypatch.setattr(vector_search, "FAISS_IVF_THRESHOLD", 100)
+    monkeypatch.setattr(vector_search, "VECTOR_EXACT_SEARCH_MAX", 10)
+    
+    def snippets(start, stop):
+        return [
+            {"code": f"def f{i}(): return {i}", "description": f"function number {i}", "language": "python"}
+            for i in range(start, stop)
+        ]
+    
+    store = VectorStore(use_pinecone=False)
+    await store.store_snippets(snippets(0, 30))
+    assert store._rebuild_task is None
+    
+    await store.store_snippets(snippets(30, 60))
+    await store._rebuild_task
+    assert isinstance(store._hnsw(), vector_search.faiss.IndexHNSWSQ)
+    
+    await store.store_snippets(snippets(60, 120))
+    await store._rebuild_task
+    assert vector_search.faiss.try_extract_index_ivf(store.index) is not None
+    assert store.index.ntotal == 120
+    
+    results = await store.search(query="function number 77", limit=3)
+    assert "function number 77" in [result["description"] for result in results]
+
+
+@pytest.mark.asyncio
+async def test_vector_store_delete_survives_reload():
+    """Test deleted snippets stay out of search results after the store is reloaded"""
+    from vector_search import VectorStore
+    
+    store = VectorStore(use_pinecone=False)
+    ids = await store.store_snippets([
+        {"code": "def login(): pass", "description": "user login handler", "language": "python"},
+        {"code": "def logout(): pass", "description": "user logout handler", "language": "python"},
+    ])
+    await store.delete_snippet(ids[0])
+    await store.flush()
+    
+    reloaded = VectorStore(use_pinecone=False)
+    assert reloaded.deleted_ids == {int(ids[0])}
+    
+    results = await reloaded.search(query="user login handler", limit=5)
+    assert [result["description"] for result in results] == ["user logout handler"]
+
+
 @pytest.mark.asyncio
 async def test_ai_engine():
     """Test AI engine components"""
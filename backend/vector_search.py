@@ -4,7 +4,12 @@ Using FAISS for local deployment or Pinecone for cloud
 """
 
 import os
-from typing import List, Dict, Any, Optional
+import math
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 import numpy as np
 
 try:
@@ -15,6 +20,7 @@ except ImportError:
     print("Warning: faiss not installed. Using fallback mode.")
 
 try:
+    import torch
     from sentence_transformers import SentenceTransformer
     SENTENCE_TRANSFORMERS_AVAILABLE = True
 except ImportError:
@@ -22,8 +28,276 @@ except ImportError:
     print("Warning: sentence-transformers not installed. Semantic search disabled.")
     print("Install with: pip install sentence-transformers")
 
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+    ONNX_RUNTIME_AVAILABLE = True
+except ImportError:
+    ONNX_RUNTIME_AVAILABLE = False  # EMBED_ONNX_MODEL needs onnxruntime and tokenizers
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False  # metadata falls back to the json module
+
 import json
-import pickle
+
+# Optional directory holding an ONNX export of all-MiniLM-L6-v2 (model.onnx, or an
+# INT8 model_quantized.onnx, plus tokenizer.json); replaces the PyTorch encoder
+EMBED_ONNX_MODEL = os.getenv("EMBED_ONNX_MODEL", "")
+ONNX_ENCODER_ENABLED = bool(EMBED_ONNX_MODEL) and ONNX_RUNTIME_AVAILABLE
+
+# Split the cores between FAISS's OpenMP pool and the encoder's intra-op pool, so
+# concurrent searches and encodes don't oversubscribe the CPU
+_HALF_CORES = max(1, (os.cpu_count() or 2) // 2)
+FAISS_OMP_THREADS = int(os.getenv("FAISS_OMP_THREADS", str(_HALF_CORES)))
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", str(_HALF_CORES)))
+
+# PyTorch encoder placement: EMBED_DEVICE (default: CUDA when available, run in FP16),
+# optionally torch.compile'd at start-up
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "")
+EMBED_TORCH_COMPILE = os.getenv("EMBED_TORCH_COMPILE", "false").lower() == "true"
+
+# Micro-batching of snippet embeddings (1 = encode each snippet on its own)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = int(os.getenv("EMBED_MAX_WAIT_MS", "20"))
+SEARCH_MAX_WAIT_MS = int(os.getenv("SEARCH_MAX_WAIT_MS", "5"))
+
+# FAISS index tuning: exhaustive search until the corpus reaches FAISS_HNSW_THRESHOLD,
+# then an HNSW graph (32 links per node over 8-bit scalar codes) until FAISS_IVF_THRESHOLD,
+# then retrain into IVF-PQ (48 sub-quantizers of 8 dims each for 384-dim vectors)
+FAISS_HNSW_THRESHOLD = int(os.getenv("FAISS_HNSW_THRESHOLD", "10000"))
+FAISS_IVF_THRESHOLD = int(os.getenv("FAISS_IVF_THRESHOLD", "5000000"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "8"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_PQ_SUBQUANTIZERS = 48
+# The 8-bit quantizer only learns per-dimension ranges, so a bounded sample fits it
+FAISS_SQ_TRAIN_SAMPLE = 65536
+# k-means wants at least 39 training points per centroid; IVF-PQ trains on a random
+# sample of FAISS_IVF_TRAIN_PER_LIST points per inverted list rather than every vector
+FAISS_MIN_POINTS_PER_CENTROID = 39
+FAISS_IVF_TRAIN_PER_LIST = 64
+
+# Persist the index and metadata at most every VECTOR_FLUSH_INTERVAL_S seconds,
+# or right away once VECTOR_FLUSH_EVERY_N snippets are pending
+VECTOR_FLUSH_INTERVAL_S = float(os.getenv("VECTOR_FLUSH_INTERVAL_S", "5"))
+VECTOR_FLUSH_EVERY_N = int(os.getenv("VECTOR_FLUSH_EVERY_N", "100"))
+
+# Below this many snippets, search scores every stored embedding with one NumPy
+# matrix-vector product instead of calling into FAISS
+VECTOR_EXACT_SEARCH_MAX = int(os.getenv("VECTOR_EXACT_SEARCH_MAX", "8192"))
+
+# Embedding rows buffered before one index.add (drained early by searches and saves)
+VECTOR_ADD_BUFFER = int(os.getenv("VECTOR_ADD_BUFFER", "64"))
+
+# Archive rows copied into a new index tier per index.add while it's rebuilt
+VECTOR_REBUILD_CHUNK = 16384
+
+# Search result cache: exact hits on the normalized query, then semantic hits on
+# any recent query embedding at least SEARCH_CACHE_SIMILARITY cosine-similar
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_SEMANTIC_SIZE = int(os.getenv("SEARCH_CACHE_SEMANTIC_SIZE", "256"))
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.97"))
+
+# Snippet metadata is stored column-wise: one list per field, indexed by FAISS row
+METADATA_FIELDS = ("id", "code", "description", "language", "user_id")
+
+
+class OnnxEncoder:
+    """
+    Sentence encoder running an ONNX export of the embedding model on onnxruntime
+    
+    Mirrors SentenceTransformer.encode: tokenize, run the graph, then mean-pool the
+    token states over the attention mask (and optionally L2-normalize) in NumPy.
+    """
+    
+    def __init__(self, model_dir: str, max_length: int = 256):
+        model_file = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_file):
+            model_file = os.path.join(model_dir, "model.onnx")
+        
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = ENCODER_THREADS
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+    
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Embed a string (1-D result) or a list of strings (2-D result)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_states = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            batches.append((token_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+        
+        embeddings = np.concatenate(batches).astype(np.float32)
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent texts into a single batched encoder call
+    
+    Texts submitted within `max_wait_ms` of each other (up to `max_batch_size`)
+    are encoded together in a worker thread, which amortizes the model's per-call
+    overhead, and each caller gets back its own embedding row.
+    """
+    
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait_ms: int = 20):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dispatches: Set[asyncio.Task] = set()  # strong refs until each batch finishes
+    
+    async def submit(self, text: str) -> np.ndarray:
+        """Queue a text and wait for its embedding"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._collect())
+        
+        future = loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _collect(self):
+        """Gather queued texts into batches and dispatch them"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without blocking collection of the next batch
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch(self, batch: List[tuple]):
+        """Encode one batch off the event loop and resolve each caller's future"""
+        try:
+            embeddings = await asyncio.to_thread(self.encode, [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+class SearchCache:
+    """
+    Two-tier cache of search results
+    
+    Exact hits are looked up by (language, normalized query, limit) in an LRU. On a
+    miss, the query embedding is compared against a ring of recent query embeddings
+    and a cached result for the same language and limit is reused when their cosine
+    similarity reaches `similarity`. clear() must be called whenever the index changes.
+    """
+    
+    def __init__(self, dim: int, max_size: int = 1024, semantic_size: int = 256, similarity: float = 0.97):
+        self.max_size = max_size
+        self.similarity = similarity
+        self.generation = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._exact: "OrderedDict[tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._embeddings = np.zeros((semantic_size, dim), dtype=np.float32)
+        self._entries: List[Optional[tuple]] = [None] * semantic_size
+        self._next = 0
+    
+    @staticmethod
+    def key(query: str, language: Optional[str], limit: int) -> tuple:
+        """Cache key for a search, ignoring case and whitespace differences"""
+        return (language, " ".join(query.split()).lower(), limit)
+    
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        """Return the results cached for exactly this search, or None"""
+        results = self._exact.get(key)
+        if results is not None:
+            self._exact.move_to_end(key)
+            self.hits += 1
+        return results
+    
+    def get_similar(self, key: tuple, embedding: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        """Return the results of the closest similar cached query, or None"""
+        if self._entries:
+            similarities = self._embeddings @ embedding
+            candidates = np.flatnonzero(similarities >= self.similarity)
+            for slot in candidates[np.argsort(-similarities[candidates])]:
+                entry = self._entries[slot]
+                if entry is not None and entry[0] == (key[0], key[2]):
+                    self.semantic_hits += 1
+                    return entry[1]
+        
+        self.misses += 1
+        return None
+    
+    def put(self, key: tuple, embedding: np.ndarray, results: List[Dict[str, Any]], generation: int):
+        """Cache fresh results, unless the index changed since the search started"""
+        if generation != self.generation:
+            return
+        
+        if self.max_size > 0:
+            self._exact[key] = results
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_size:
+                self._exact.popitem(last=False)
+        
+        if self._entries:
+            # Overwrite the oldest semantic entry
+            self._embeddings[self._next] = embedding
+            self._entries[self._next] = ((key[0], key[2]), results)
+            self._next = (self._next + 1) % len(self._entries)
+    
+    def clear(self):
+        """Drop every cached result (the indexed snippets changed)"""
+        self.generation += 1
+        self._exact.clear()
+        self._embeddings.fill(0)
+        self._entries = [None] * len(self._entries)
+        self._next = 0
+
+
+def _content_key(snippet: Dict[str, Any]) -> bytes:
+    """Hash a snippet's searchable text, language and owner into a compact dedup key"""
+    data = (
+        f"{snippet['language']}\0{snippet.get('user_id') or ''}\0"
+        f"{snippet['description']}\n\n{snippet['code']}"
+    ).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
 
 
 class VectorStore:
@@ -33,16 +307,37 @@ class VectorStore:
     
     def __init__(self, use_pinecone: bool = False):
         self.use_pinecone = use_pinecone
-        self.enabled = SENTENCE_TRANSFORMERS_AVAILABLE
+        self.enabled = SENTENCE_TRANSFORMERS_AVAILABLE or ONNX_ENCODER_ENABLED
         self.index = None
+        self._dirty = False
+        self._pending_writes = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._save_task: Optional[asyncio.Task] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
         
         if not self.enabled:
-            print("VectorStore disabled - sentence-transformers not available")
+            print("VectorStore disabled - install sentence-transformers or set EMBED_ONNX_MODEL")
             return
         
         # Initialize embedding model
-        self.encoder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        if ONNX_ENCODER_ENABLED:
+            self.encoder = OnnxEncoder(EMBED_ONNX_MODEL)
+        else:
+            device = EMBED_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+            self.encoder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=device)
+            torch.set_num_threads(ENCODER_THREADS)
+            if device.startswith("cuda"):
+                self.encoder.half()  # MiniLM embeddings are stable in FP16
+            if EMBED_TORCH_COMPILE:
+                transformer = self.encoder._first_module()
+                transformer.auto_model = torch.compile(transformer.auto_model, mode="reduce-overhead")
         self.embedding_dim = 384  # Dimension for all-MiniLM-L6-v2
+        self.encode = self._encode
+        self.embedding_batcher = EmbeddingBatcher(self.encode, EMBED_BATCH_SIZE, EMBED_MAX_WAIT_MS)
+        self.query_batcher = EmbeddingBatcher(self.encode, EMBED_BATCH_SIZE, SEARCH_MAX_WAIT_MS)
+        self.search_cache = SearchCache(
+            self.embedding_dim, SEARCH_CACHE_SIZE, SEARCH_CACHE_SEMANTIC_SIZE, SEARCH_CACHE_SIMILARITY
+        )
         
         if use_pinecone:
             self._init_pinecone()
@@ -55,21 +350,278 @@ class VectorStore:
                 return
         
         # Storage for metadata
-        self.metadata_store = []
+        self.metadata_columns: Dict[str, list] = {field: [] for field in METADATA_FIELDS}
+        self._languages: Optional[np.ndarray] = None
+        self._language_selectors: Dict[str, tuple] = {}
+        self._live_selector_cache: Optional[tuple] = None
+        self.deleted_ids: Set[int] = set()
+        self._live: Optional[np.ndarray] = None
+        self._live_deleted = 0
         self.metadata_file = "vector_metadata.json"
         self._load_metadata()
+        
+        # Content hash -> id of the live snippet holding it, so re-uploads skip the encoder
+        self._hash_to_id: Dict[bytes, int] = {
+            _content_key(dict(zip(METADATA_FIELDS, row))): row[0]
+            for row in zip(*(self.metadata_columns[field] for field in METADATA_FIELDS))
+            if row[0] not in self.deleted_ids
+        }
+        if not self.use_pinecone:
+            self._restore_vectors()
+    
+    def _encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """
+        Unit-length embeddings (so inner product equals cosine similarity), one row per text
+        
+        A lone text on the PyTorch encoder skips SentenceTransformer.encode's batching
+        (length sorting, per-batch tensor stacking and list conversion) and runs the
+        tokenizer, model and pooling directly.
+        """
+        if ONNX_ENCODER_ENABLED or len(texts) != 1:
+            return self.encoder.encode(texts, normalize_embeddings=True, **kwargs)
+        
+        features = self.encoder.tokenize(texts)
+        features = {name: tensor.to(self.encoder.device) for name, tensor in features.items()}
+        with torch.inference_mode():
+            embedding = self.encoder(features)["sentence_embedding"]
+            embedding = torch.nn.functional.normalize(embedding.float(), dim=1)
+        return embedding.cpu().numpy()
     
     def _init_faiss(self):
         """Initialize FAISS index for local vector search"""
         if not FAISS_AVAILABLE:
             return
             
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
+        faiss.omp_set_num_threads(FAISS_OMP_THREADS)
+        self.index = self._new_flat_index()
         self.index_file = "faiss_index.bin"
+        self.nprobe = FAISS_NPROBE
+        self.ef_search = FAISS_EF_SEARCH
+        # Searches and saves run in worker threads; the index lock guards the index,
+        # add buffer, exact-search matrix and metadata columns against concurrent adds
+        self._index_lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()  # one tier rebuild at a time
+        self._pending = np.empty((max(1, VECTOR_ADD_BUFFER), self.embedding_dim), dtype=np.float32)
+        self._pending_rows = 0
+        # Reused for every FAISS query (searches run one at a time under the index lock)
+        self._qbuf = np.empty((1, self.embedding_dim), dtype=np.float32)
+        # Vectors are added under their snippet id, so FAISS ids index the metadata columns
+        self._next_vector_id = 0
+        
+        # Dimension-major copy of every embedding (column = snippet id) while the corpus is small
+        self.emb_soa: Optional[np.ndarray] = np.empty((self.embedding_dim, 256), dtype=np.float32)
+        self._soa_rows = 0
+        
+        # Archive of the original float32 embeddings, one row per snippet id, used to rebuild
+        # the exact-search matrix and the HNSW and IVF-PQ tiers without decoding PQ codes.
+        # Saves append new rows; loads memory-map the file.
+        self.embeddings_file = "embeddings.f32"
+        self._raw: Optional[np.ndarray] = None
+        self._raw_unsaved: List[np.ndarray] = []
+        self._raw_saved_rows = 0
+        self._raw_enabled = False
         
-        # Load existing index if available
+        # Load existing index if available. IVF lists are memory-mapped read-only so
+        # start-up only pages in what searches touch; the first write loads a copy.
+        self._index_mapped = False
         if os.path.exists(self.index_file):
-            self.index = faiss.read_index(self.index_file)
+            index = faiss.read_index(self.index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            if isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+                # IVF lists store ids natively
+                self.index = index
+                self._index_mapped = isinstance(index, faiss.IndexIVF)
+                self._apply_search_params()
+            elif index.ntotal:
+                # Migrate an older index without ids (rows in snippet order), normalizing
+                # raw L2 embeddings for cosine scoring
+                ivf = faiss.try_extract_index_ivf(index)
+                if ivf is not None:
+                    ivf.make_direct_map()
+                vectors = index.reconstruct_n(0, index.ntotal)
+                if index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                    faiss.normalize_L2(vectors)
+                self.index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    
+    def _restore_vectors(self):
+        """Resume id assignment and rebuild the exact-search matrix after loading from disk"""
+        snippet_count = len(self.metadata_columns["id"])
+        self._next_vector_id = snippet_count
+        self._load_raw(snippet_count)
+        if not snippet_count:
+            return
+        
+        if snippet_count >= VECTOR_EXACT_SEARCH_MAX or faiss.try_extract_index_ivf(self.index) is not None:
+            self.emb_soa = None
+            return
+        
+        # Deleted snippets are masked out at search time
+        self._append_soa(np.asarray(self._raw))
+    
+    def _load_raw(self, count: int):
+        """Memory-map the embedding archive, backfilling it from the index for older stores"""
+        row_bytes = 4 * self.embedding_dim
+        rows = os.path.getsize(self.embeddings_file) // row_bytes if os.path.exists(self.embeddings_file) else 0
+        if rows < count:
+            if faiss.try_extract_index_ivf(self.index) is not None:
+                return  # PQ codes can't be decoded back into the original embeddings
+            vectors, ids = self._id_mapped_vectors()
+            matrix = np.zeros((count, self.embedding_dim), dtype=np.float32)
+            matrix[ids] = vectors
+            matrix.tofile(self.embeddings_file)
+        elif rows > count:
+            # Rows appended by a save that didn't complete
+            os.truncate(self.embeddings_file, count * row_bytes)
+        
+        self._raw_enabled = True
+        self._raw_saved_rows = count
+        self._raw = self._map_raw(count)
+    
+    def _map_raw(self, rows: int) -> Optional[np.ndarray]:
+        """Read-only (rows, dim) view of the saved embedding archive"""
+        if not rows:
+            return None
+        return np.memmap(self.embeddings_file, dtype=np.float32, mode="r", shape=(rows, self.embedding_dim))
+    
+    def _archived(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Archived embeddings for sorted snippet `ids`, one row each
+        
+        Saved rows are gathered straight from the memory map, so only the requested
+        rows are read; newer rows come from the unsaved chunks.
+        """
+        saved = int(np.searchsorted(ids, self._raw_saved_rows))
+        parts = [self._raw[ids[:saved]]] if saved else []
+        if saved < len(ids):
+            unsaved = np.concatenate(self._raw_unsaved)
+            parts.append(unsaved[ids[saved:] - self._raw_saved_rows])
+        if not parts:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+    
+    def _id_mapped_vectors(self) -> tuple:
+        """Every vector in the (non-IVF) index, with its snippet id"""
+        inner = faiss.downcast_index(self.index.index)
+        return inner.reconstruct_n(0, inner.ntotal), faiss.vector_to_array(self.index.id_map)
+    
+    def _new_flat_index(self):
+        """Exhaustive inner-product index over float32 vectors, keyed by snippet id"""
+        return faiss.index_factory(self.embedding_dim, "IDMap2,Flat", faiss.METRIC_INNER_PRODUCT)
+    
+    def _hnsw(self):
+        """The HNSW graph behind the id map, or None for the other index tiers"""
+        if not isinstance(self.index, faiss.IndexIDMap2):
+            return None
+        inner = faiss.downcast_index(self.index.index)
+        return inner if isinstance(inner, faiss.IndexHNSW) else None
+    
+    def _apply_search_params(self):
+        """Set how many IVF cells or HNSW candidates each query visits (no-op for flat indexes)"""
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+        hnsw = self._hnsw()
+        if hnsw is not None:
+            hnsw.hnsw.efSearch = self.ef_search
+    
+    def _ivf_layout(self, n: int) -> Tuple[str, int]:
+        """
+        FAISS factory string for an IVF-PQ index over `n` vectors, and its training sample size
+        
+        The list count and PQ code width shrink on small corpora so the sample always
+        holds enough points for both the coarse and the sub-quantizer k-means.
+        """
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // FAISS_MIN_POINTS_PER_CENTROID))
+        nbits = int(np.clip(np.log2(max(n, 1) / FAISS_MIN_POINTS_PER_CENTROID), 1, 8))
+        n_train = min(n, max(FAISS_IVF_TRAIN_PER_LIST * nlist,
+                             FAISS_MIN_POINTS_PER_CENTROID * 2 ** nbits))
+        return f"IVF{nlist},PQ{FAISS_PQ_SUBQUANTIZERS}x{nbits}", n_train
+    
+    def _due_tier(self) -> Optional[str]:
+        """The tier ("hnsw" or "ivf") the corpus has outgrown its index into, or None"""
+        if faiss.try_extract_index_ivf(self.index) is not None:
+            return None
+        
+        live = len(self.metadata_columns["id"]) - len(self.deleted_ids)
+        if live >= FAISS_IVF_THRESHOLD:
+            return "ivf"
+        if live >= FAISS_HNSW_THRESHOLD and self._hnsw() is None:
+            return "hnsw"
+        return None
+    
+    def _schedule_rebuild(self):
+        """Start a background tier rebuild if one is due (called on the event loop)"""
+        loop = asyncio.get_running_loop()
+        task = self._rebuild_task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        if self._due_tier() is not None:
+            self._rebuild_task = loop.create_task(self._rebuild())
+    
+    async def _rebuild(self):
+        """Rebuild the index in a worker thread, then schedule a save of the new tier"""
+        if await asyncio.to_thread(self._rebuild_index):
+            self._mark_dirty(0)
+    
+    def _read_archived(self, ids: np.ndarray) -> np.ndarray:
+        """_archived under the index lock, for readers outside it (blocking)"""
+        with self._index_lock:
+            return np.ascontiguousarray(self._archived(ids))
+    
+    def _rebuild_index(self) -> bool:
+        """
+        Rebuild the index as HNSW, or IVF-PQ, from the embedding archive (blocking)
+        
+        The current index keeps serving while the new one is built outside the index
+        lock, chunk by chunk; snippets added or deleted meanwhile are applied under
+        the lock just before the swap. Returns whether the index was replaced.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._index_lock:
+                tier = self._due_tier()
+                if tier is None or not self._raw_enabled:
+                    return False
+                self._add_pending()
+                built = self._next_vector_id
+                deleted = set(self.deleted_ids)
+            
+            ids = np.arange(built, dtype=np.int64)
+            if deleted:
+                ids = np.setdiff1d(ids, np.fromiter(deleted, dtype=np.int64, count=len(deleted)))
+            if tier == "ivf":
+                factory, n_train = self._ivf_layout(len(ids))
+            else:
+                # SQ8 codes take a quarter of the float32 graph storage; once their ranges
+                # are trained, later snippets are added to the graph incrementally
+                factory, n_train = f"IDMap2,HNSW{FAISS_HNSW_M}_SQ8", min(len(ids), FAISS_SQ_TRAIN_SAMPLE)
+            index = faiss.index_factory(self.embedding_dim, factory, faiss.METRIC_INNER_PRODUCT)
+            if tier == "hnsw":
+                faiss.downcast_index(index.index).hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+            sample = np.sort(np.random.default_rng().choice(ids, n_train, replace=False))
+            index.train(self._read_archived(sample))
+            for start in range(0, len(ids), VECTOR_REBUILD_CHUNK):
+                chunk = ids[start:start + VECTOR_REBUILD_CHUNK]
+                index.add_with_ids(self._read_archived(chunk), chunk)
+            
+            with self._index_lock:
+                self._add_pending()
+                late = np.arange(built, self._next_vector_id, dtype=np.int64)
+                if self.deleted_ids:
+                    late = late[~np.isin(late, list(self.deleted_ids))]
+                if len(late):
+                    index.add_with_ids(np.ascontiguousarray(self._archived(late)), late)
+                # HNSW graphs can't drop nodes; searches skip deleted ids instead
+                gone = self.deleted_ids - deleted
+                if gone and tier == "ivf":
+                    index.remove_ids(faiss.IDSelectorBatch(np.array(sorted(gone), dtype=np.int64)))
+                self.index = index
+                self._index_mapped = False
+                self._apply_search_params()
+            return True
+        finally:
+            self._rebuild_lock.release()
     
     def _init_pinecone(self):
         """Initialize Pinecone for cloud vector search"""
@@ -100,13 +652,136 @@ class VectorStore:
     def _load_metadata(self):
         """Load metadata from disk"""
         if os.path.exists(self.metadata_file):
-            with open(self.metadata_file, 'r') as f:
-                self.metadata_store = json.load(f)
+            with open(self.metadata_file, 'rb') as f:
+                data = f.read()
+            stored = orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+            if isinstance(stored, list):
+                # Older files hold one dict per snippet
+                self.metadata_columns = {field: [row.get(field) for row in stored] for field in METADATA_FIELDS}
+            else:
+                self.metadata_columns = {field: stored[field] for field in METADATA_FIELDS}
+                self.deleted_ids = set(stored.get("deleted", []))
+    
+    def _save_metadata(self, columns: Dict[str, list]):
+        """Save metadata to disk (written to a temp file, then swapped in)"""
+        tmp_file = self.metadata_file + ".tmp"
+        if ORJSON_AVAILABLE:
+            with open(tmp_file, 'wb') as f:
+                f.write(orjson.dumps(columns))
+        else:
+            with open(tmp_file, 'w') as f:
+                json.dump(columns, f)
+        os.replace(tmp_file, self.metadata_file)
+    
+    def _save(self):
+        """Write the FAISS index and metadata to disk (blocking; run in a worker thread)"""
+        with self._save_lock:
+            # Snapshot a consistent index and metadata, then write without holding up adds
+            with self._index_lock:
+                self._add_pending()
+                self._dirty = False
+                self._pending_writes = 0
+                index_bytes = faiss.serialize_index(self.index)
+                columns = {field: list(column) for field, column in self.metadata_columns.items()}
+                columns["deleted"] = sorted(self.deleted_ids)
+                unsaved = list(self._raw_unsaved) if self._raw_enabled else []
+            
+            # Embedding rows first: a load drops any rows beyond the saved metadata
+            if unsaved:
+                with open(self.embeddings_file, 'ab') as f:
+                    for chunk in unsaved:
+                        chunk.tofile(f)
+            
+            tmp_file = self.index_file + ".tmp"
+            index_bytes.tofile(tmp_file)
+            os.replace(tmp_file, self.index_file)
+            self._save_metadata(columns)
+            
+            if unsaved:
+                with self._index_lock:
+                    del self._raw_unsaved[:len(unsaved)]
+                    self._raw_saved_rows += sum(len(chunk) for chunk in unsaved)
+                    self._raw = self._map_raw(self._raw_saved_rows)
+    
+    def _append_soa(self, embeddings: np.ndarray):
+        """Copy new embeddings into the exact-search matrix, dropping it once the corpus outgrows it"""
+        if self.emb_soa is None:
+            return
+        
+        rows = self._soa_rows + len(embeddings)
+        if rows >= VECTOR_EXACT_SEARCH_MAX:
+            self.emb_soa = None
+            return
+        if rows > self.emb_soa.shape[1]:
+            grown = np.empty((self.embedding_dim, max(rows, 2 * self.emb_soa.shape[1])), dtype=np.float32)
+            grown[:, :self._soa_rows] = self.emb_soa[:, :self._soa_rows]
+            self.emb_soa = grown
+        
+        self.emb_soa[:, self._soa_rows:rows] = embeddings.T
+        self._soa_rows = rows
+    
+    def _queue_vectors(self, embeddings: np.ndarray):
+        """Copy embedding rows into the add buffer, adding them to the index once it fills"""
+        self._append_soa(embeddings)
+        if self._raw_enabled:
+            self._raw_unsaved.append(np.array(embeddings, dtype=np.float32))
+        count = len(embeddings)
+        if self._pending_rows + count > len(self._pending):
+            self._add_pending()
+            if count > len(self._pending):
+                # Bulk loads bypass the buffer
+                self._ensure_writable()
+                self.index.add_with_ids(np.ascontiguousarray(embeddings, dtype=np.float32), self._take_ids(count))
+                return
+        
+        self._pending[self._pending_rows:self._pending_rows + count] = embeddings
+        self._pending_rows += count
+        if self._pending_rows == len(self._pending):
+            self._add_pending()
+    
+    def _add_pending(self):
+        """Add the buffered embedding rows to the index in one call"""
+        if self._pending_rows:
+            self._ensure_writable()
+            self.index.add_with_ids(self._pending[:self._pending_rows], self._take_ids(self._pending_rows))
+            self._pending_rows = 0
+    
+    def _ensure_writable(self):
+        """Swap a memory-mapped index for an in-memory copy before modifying it"""
+        if self._index_mapped:
+            self.index = faiss.read_index(self.index_file)
+            self._index_mapped = False
+            self._apply_search_params()
+    
+    def _take_ids(self, count: int) -> np.ndarray:
+        """Snippet ids for the next `count` vectors added to the index"""
+        ids = np.arange(self._next_vector_id, self._next_vector_id + count, dtype=np.int64)
+        self._next_vector_id += count
+        return ids
+    
+    def _mark_dirty(self, count: int):
+        """Record unsaved changes and schedule (or force) a flush"""
+        self._dirty = True
+        self._pending_writes += count
+        loop = asyncio.get_running_loop()
+        if self._pending_writes >= VECTOR_FLUSH_EVERY_N:
+            if self._save_task is None or self._save_task.done() or self._save_task.get_loop() is not loop:
+                self._save_task = loop.create_task(self.flush())
+            return
+        
+        if self._flush_task is None or self._flush_task.done() or self._flush_task.get_loop() is not loop:
+            self._flush_task = loop.create_task(self._flush_loop())
     
-    def _save_metadata(self):
-        """Save metadata to disk"""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(self.metadata_store, f, indent=2)
+    async def _flush_loop(self):
+        """Persist pending changes at most once every VECTOR_FLUSH_INTERVAL_S"""
+        while self._dirty:
+            await asyncio.sleep(VECTOR_FLUSH_INTERVAL_S)
+            await self.flush()
+    
+    async def flush(self):
+        """Write any unsaved snippets to disk now"""
+        if self._dirty:
+            await asyncio.to_thread(self._save)
     
     async def store_snippet(
         self, 
@@ -121,35 +796,194 @@ class VectorStore:
         if not self.enabled:
             return "0"  # Return dummy ID when disabled
         
+        snippet = {"code": code, "description": description, "language": language, "user_id": user_id}
+        key = _content_key(snippet)
+        existing = self._hash_to_id.get(key)
+        if existing is not None:
+            return str(existing)
+        
         # Create searchable text combining code and description
         searchable_text = f"{description}\n\n{code}"
         
-        # Generate embedding
-        embedding = self.encoder.encode([searchable_text])[0]
+        # Generate embedding (batched with any concurrent store_snippet calls)
+        embedding = await self.embedding_batcher.submit(searchable_text)
         
-        # Metadata
-        metadata = {
-            "id": len(self.metadata_store),
-            "code": code,
-            "description": description,
-            "language": language,
-            "user_id": user_id
-        }
+        return (await self._add_snippets([snippet], embedding[None], [key]))[0]
+    
+    async def store_snippets(self, snippets: List[Dict[str, Any]]) -> List[str]:
+        """
+        Store many code snippets with one encoder pass and one index update
         
+        Each item takes the same fields as store_snippet (code, description, language, user_id).
+        """
+        if not self.enabled:
+            return ["0"] * len(snippets)
+        if not snippets:
+            return []
+        
+        # Encode each distinct piece of content once, skipping anything already stored
+        keys = [_content_key(snippet) for snippet in snippets]
+        ids: Dict[bytes, str] = {}
+        fresh: Dict[bytes, Dict[str, Any]] = {}
+        for key, snippet in zip(keys, snippets):
+            existing = self._hash_to_id.get(key)
+            if existing is not None:
+                ids[key] = str(existing)
+            else:
+                fresh.setdefault(key, snippet)
+        
+        if fresh:
+            texts = [f"{snippet['description']}\n\n{snippet['code']}" for snippet in fresh.values()]
+            embeddings = await asyncio.to_thread(self.encode, texts, batch_size=64, convert_to_numpy=True)
+            ids.update(zip(fresh, await self._add_snippets(list(fresh.values()), embeddings, list(fresh))))
+        return [ids[key] for key in keys]
+    
+    @staticmethod
+    def _metadata_row(snippet_id: int, snippet: Dict[str, Any]) -> Dict[str, Any]:
+        """The stored metadata fields of one snippet"""
+        return {
+            "id": snippet_id,
+            "code": snippet["code"],
+            "description": snippet["description"],
+            "language": snippet["language"],
+            "user_id": snippet.get("user_id")
+        }
+    
+    async def _add_snippets(
+        self, snippets: List[Dict[str, Any]], embeddings: np.ndarray, keys: List[bytes]
+    ) -> List[str]:
+        """Record metadata for encoded snippets and add their vectors to the index"""
         if self.use_pinecone:
             # Store in Pinecone
-            self.index.upsert([(str(metadata["id"]), embedding.tolist(), metadata)])
-        else:
-            # Store in FAISS
-            if FAISS_AVAILABLE and self.index is not None:
-                self.index.add(np.array([embedding]))
-                self.metadata_store.append(metadata)
+            start = len(self.metadata_columns["id"])
+            metadata = [self._metadata_row(start + offset, snippet) for offset, snippet in enumerate(snippets)]
+            await asyncio.to_thread(self.index.upsert, [
+                (str(item["id"]), embedding.tolist(), item)
+                for item, embedding in zip(metadata, embeddings)
+            ])
+            self.search_cache.clear()
+            return [str(item["id"]) for item in metadata]
+        
+        if not FAISS_AVAILABLE or self.index is None:
+            return ["0"] * len(snippets)
+        
+        # Store in FAISS; the index lock is only ever taken in worker threads
+        ids, added = await asyncio.to_thread(self._insert_snippets, snippets, embeddings, keys)
+        if added:
+            # After the insert, so searches that raced it can't cache stale results
+            self.search_cache.clear()
+            # Saved to disk by the next flush
+            self._mark_dirty(added)
+            self._schedule_rebuild()
+        return ids
+    
+    def _insert_snippets(
+        self, snippets: List[Dict[str, Any]], embeddings: np.ndarray, keys: List[bytes]
+    ) -> tuple:
+        """Add snippets whose content isn't stored yet (blocking); returns every id and the number added"""
+        with self._index_lock:
+            # A concurrent call may have stored the same content while this one was encoding
+            ids = [self._hash_to_id.get(key) for key in keys]
+            fresh = [offset for offset, existing in enumerate(ids) if existing is None]
+            if fresh:
+                start = len(self.metadata_columns["id"])
+                for new_id, offset in enumerate(fresh, start):
+                    ids[offset] = new_id
+                metadata = [self._metadata_row(ids[offset], snippets[offset]) for offset in fresh]
                 
-                # Save to disk
-                faiss.write_index(self.index, self.index_file)
-                self._save_metadata()
+                self._queue_vectors(embeddings[fresh] if len(fresh) < len(snippets) else embeddings)
+                for field, column in self.metadata_columns.items():
+                    column.extend(item[field] for item in metadata)
+                self._hash_to_id.update((keys[offset], ids[offset]) for offset in fresh)
         
-        return str(metadata["id"])
+        return [str(snippet_id) for snippet_id in ids], len(fresh)
+    
+    def _language_array(self) -> np.ndarray:
+        """NumPy copy of the language column, rebuilt only after new snippets arrive"""
+        languages = self.metadata_columns["language"]
+        if self._languages is None or len(self._languages) != len(languages):
+            self._languages = np.array(languages, dtype=str)
+        return self._languages
+    
+    def _live_mask(self) -> np.ndarray:
+        """Boolean mask over snippet ids, False for deleted snippets"""
+        count = len(self.metadata_columns["id"])
+        if self._live is None or len(self._live) != count or self._live_deleted != len(self.deleted_ids):
+            live = np.ones(count, dtype=bool)
+            live[list(self.deleted_ids)] = False
+            self._live, self._live_deleted = live, len(self.deleted_ids)
+        return self._live
+    
+    def _language_selector(self, language: str):
+        """FAISS IDSelector over one language's live snippets (None if it has none), cached until snippets change"""
+        version = (len(self.metadata_columns["id"]), len(self.deleted_ids))
+        cached = self._language_selectors.get(language)
+        if cached is None or cached[0] != version:
+            ids = np.flatnonzero((self._language_array() == language) & self._live_mask()).astype(np.int64)
+            cached = (version, faiss.IDSelectorBatch(ids) if len(ids) else None)
+            self._language_selectors[language] = cached
+        return cached[1]
+    
+    def _live_selector(self):
+        """FAISS IDSelector rejecting deleted snippets, cached until the next delete"""
+        cached = self._live_selector_cache
+        if cached is None or cached[0] != len(self.deleted_ids):
+            deleted = faiss.IDSelectorBatch(np.fromiter(self.deleted_ids, dtype=np.int64, count=len(self.deleted_ids)))
+            # Keep the batch selector alive alongside the wrapper that points at it
+            cached = (len(self.deleted_ids), deleted, faiss.IDSelectorNot(deleted))
+            self._live_selector_cache = cached
+        return cached[2]
+    
+    def _nearest(self, query_embedding: np.ndarray, k: int, language: Optional[str] = None) -> tuple:
+        """
+        Snippet ids and cosine scores of the `k` closest live snippets, best first (blocking)
+        
+        A language restricts the search itself rather than filtering its hits, so rare
+        languages still get `k` matches.
+        """
+        no_hits = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        with self._index_lock:
+            if self.emb_soa is not None:
+                # Small corpus: exact scores from one matrix-vector product
+                scores = query_embedding @ self.emb_soa[:, :self._soa_rows]
+                if self.deleted_ids:
+                    scores[~self._live_mask()[:len(scores)]] = -np.inf
+                if language:
+                    scores[self._language_array()[:len(scores)] != language] = -np.inf
+                if k < len(scores):
+                    top = np.argpartition(-scores, k)[:k]
+                else:
+                    top = np.arange(len(scores))
+                top = top[np.argsort(-scores[top])]
+                top = top[np.isfinite(scores[top])]
+                # Float rounding can push scores a hair past the cosine range
+                return top, np.clip(scores[top], -1.0, 1.0)
+            
+            # Search in FAISS, including any still-buffered rows
+            self._add_pending()
+            hnsw = self._hnsw()
+            selector = None
+            if language:
+                selector = self._language_selector(language)
+                if selector is None:
+                    return no_hits
+            elif hnsw is not None and self.deleted_ids:
+                selector = self._live_selector()
+            
+            params = None
+            if selector is not None:
+                if isinstance(self.index, faiss.IndexIVF):
+                    params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+                elif hnsw is not None:
+                    params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+                else:
+                    params = faiss.SearchParameters(sel=selector)
+            self._qbuf[0] = query_embedding
+            distances, indices = self.index.search(self._qbuf, k, params=params)
+        
+        # FAISS pads missing hits with -1; PQ codes can overshoot the cosine range slightly
+        hits = indices[0] >= 0
+        return indices[0][hits], np.clip(distances[0][hits], -1.0, 1.0)
     
     async def search(
         self, 
@@ -163,57 +997,89 @@ class VectorStore:
         if not self.enabled:
             return []  # Return empty list when disabled
         
-        # Generate query embedding
-        query_embedding = self.encoder.encode([query])[0]
+        cache_key = self.search_cache.key(query, language, limit)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = self.search_cache.generation
+        
+        # Generate query embedding (batched with any concurrent searches)
+        query_embedding = await self.query_batcher.submit(query)
+        cached = self.search_cache.get_similar(cache_key, query_embedding)
+        if cached is not None:
+            return cached
         
         if self.use_pinecone:
             # Search in Pinecone
-            results = self.index.query(
+            response = await asyncio.to_thread(
+                self.index.query,
                 query_embedding.tolist(),
                 top_k=limit,
                 include_metadata=True,
                 filter={"language": language} if language else None
             )
             
-            return [
+            results = [
                 {
                     "code": match["metadata"]["code"],
                     "description": match["metadata"]["description"],
                     "language": match["metadata"]["language"],
                     "score": match["score"]
                 }
-                for match in results["matches"]
+                for match in response["matches"]
             ]
         else:
-            # Search in FAISS
-            distances, indices = self.index.search(np.array([query_embedding]), limit * 2)
-            
-            results = []
-            for idx, distance in zip(indices[0], distances[0]):
-                if idx < len(self.metadata_store):
-                    metadata = self.metadata_store[idx]
-                    
-                    # Filter by language if specified
-                    if language and metadata["language"] != language:
-                        continue
-                    
-                    results.append({
-                        "code": metadata["code"],
-                        "description": metadata["description"],
-                        "language": metadata["language"],
-                        "score": float(distance)
-                    })
-                    
-                    if len(results) >= limit:
-                        break
-            
-            return results
+            rows, scores = await asyncio.to_thread(self._nearest, query_embedding, limit, language)
+            self._schedule_rebuild()  # a store loaded past its tier upgrades on first use
+            
+            codes = self.metadata_columns["code"]
+            descriptions = self.metadata_columns["description"]
+            languages = self.metadata_columns["language"]
+            
+            # Plain ints and floats, so the comprehension indexes lists without NumPy scalars
+            results = [
+                {
+                    "code": codes[row],
+                    "description": descriptions[row],
+                    "language": languages[row],
+                    "score": score  # cosine similarity, higher is better
+                }
+                for row, score in zip(rows.tolist(), scores.tolist())
+            ]
+        
+        self.search_cache.put(cache_key, query_embedding, results, generation)
+        return results
     
     async def delete_snippet(self, snippet_id: str):
         """Delete a code snippet"""
+        if not self.enabled:
+            return
+        
+        # Clear after the removal, so searches that raced it can't cache stale results
         if self.use_pinecone:
             self.index.delete([snippet_id])
-        else:
-            # FAISS doesn't support deletion easily
-            # Would need to rebuild index excluding the item
-            pass
+            self.search_cache.clear()
+        elif FAISS_AVAILABLE and self.index is not None:
+            if await asyncio.to_thread(self._remove, int(snippet_id)):
+                self.search_cache.clear()
+                self._dirty = True
+                await self.flush()
+    
+    def _remove(self, snippet_id: int) -> bool:
+        """Drop a snippet's vector from the index and tombstone its metadata (blocking)"""
+        with self._index_lock:
+            if not 0 <= snippet_id < len(self.metadata_columns["id"]) or snippet_id in self.deleted_ids:
+                return False
+            
+            # The vector may still be waiting in the add buffer
+            self._add_pending()
+            if self._hnsw() is None:
+                self._ensure_writable()
+                self.index.remove_ids(faiss.IDSelectorBatch(np.array([snippet_id], dtype=np.int64)))
+            # else: HNSW graphs can't drop nodes, so searches skip deleted ids instead
+            if self.emb_soa is not None:
+                self.emb_soa[:, snippet_id] = 0
+            self.deleted_ids.add(snippet_id)
+            snippet = {field: self.metadata_columns[field][snippet_id] for field in METADATA_FIELDS}
+            self._hash_to_id.pop(_content_key(snippet), None)
+        return True